@@ -5,140 +5,158 @@ import logging
 import asyncio
 import serial.tools.list_ports
 import struct
-import sys
 import time
+import collections
+import re
+import array
+import importlib
+import concurrent.futures
 
-# --- Pymodbus v3.x Robust Imports ---
-print(f"Debug: Pymodbus import check...")
-
-# Check Serial Dependency
-try:
-    import serial
-    print(f"Debug: serial imported from {serial.__file__}")
-except ImportError as e:
-    print(f"Debug: FAILED to import serial: {e}")
-
-StartSerialServer = None
-StartAsyncSerialServer = None
-ModbusSerialServer = None
-ServerStop = None
-
-try:
-    import pymodbus.server
-    print(f"Debug: pymodbus.server dir: {dir(pymodbus.server)}")
-except ImportError as e:
-    print(f"Debug: Failed to import pymodbus.server module: {e}")
-
-try:
-    from pymodbus.server import StartSerialServer
-    print("Debug: Imported StartSerialServer")
-except ImportError as e:
-    print(f"Debug: Failed to import StartSerialServer: {e}")
-
-try:
-    from pymodbus.server import StartAsyncSerialServer
-    print("Debug: Imported StartAsyncSerialServer")
-except ImportError as e:
-    print(f"Debug: Failed to import StartAsyncSerialServer: {e}")
-
-try:
-    from pymodbus.server import ModbusSerialServer
-    print("Debug: Imported ModbusSerialServer")
-except ImportError as e:
-    print(f"Debug: Failed to import ModbusSerialServer: {e}")
-
-try:
-    from pymodbus.server import ServerStop
-    print("Debug: Imported ServerStop")
-except ImportError as e:
-    print(f"Debug: Failed to import ServerStop: {e}")
-
-try:
-    from pymodbus.device import ModbusDeviceIdentification
-except ImportError:
-    ModbusDeviceIdentification = None
-
-# Datastore Imports - Try multiple strategies for v3.x
-ModbusServerContext = None
-ModbusSlaveContext = None
-ModbusSequentialDataBlock = None
-
-try:
-    from pymodbus.datastore import ModbusServerContext
-    from pymodbus.datastore import ModbusSequentialDataBlock
-    print("Debug: Imported ModbusServerContext and ModbusSequentialDataBlock")
-    
-    try:
-        from pymodbus.datastore import ModbusSlaveContext
-        print("Debug: Imported ModbusSlaveContext")
-    except ImportError:
-        print("Debug: ModbusSlaveContext not available (v3.6+ - will use dict approach)")
-        
-except ImportError as e:
-    print(f"Debug: Strategy 1 failed: {e}")
-
-if ModbusServerContext is None:
-    try:
-        from pymodbus.datastore.context import ModbusServerContext
-        print("Debug: Imported ModbusServerContext from .context")
-    except ImportError as e:
-        print(f"Debug: Failed to import ModbusServerContext: {e}")
-
-if ModbusSequentialDataBlock is None:
-    try:
-        from pymodbus.datastore.store import ModbusSequentialDataBlock
-        print("Debug: Imported ModbusSequentialDataBlock from .store")
-    except ImportError:
-        try:
-            from pymodbus.datastore.sequential import ModbusSequentialDataBlock
-            print("Debug: Imported ModbusSequentialDataBlock from .sequential")
-        except ImportError as e:
-            print(f"Debug: Failed to import ModbusSequentialDataBlock: {e}")
+from register_blocks import RegisterArrayBlock
 
-# Final check and report
-print(f"Debug: ModbusServerContext = {ModbusServerContext}")
-print(f"Debug: ModbusSlaveContext = {ModbusSlaveContext}")
-print(f"Debug: ModbusSequentialDataBlock = {ModbusSequentialDataBlock}")
+# --- Pymodbus v3.x Robust Imports ---
+# Resolved silently; anything missing is reported in the GUI log once it exists
+_import_errors = []
 
-# Configure logging
-logging.basicConfig()
-log = logging.getLogger()
-log.setLevel(logging.INFO)
+def _resolve(attr, *modules):
+    """Return `attr` from the first importable module that defines it, else None"""
+    for name in modules:
+        try:
+            mod = importlib.import_module(name)
+        except ImportError:
+            continue
+        if hasattr(mod, attr):
+            return getattr(mod, attr)
+    _import_errors.append(f"{attr} not found in {', '.join(modules)}")
+    return None
+
+# Built directly (not via StartAsyncSerialServer) so stop can call its shutdown()
+ModbusSerialServer = _resolve('ModbusSerialServer', 'pymodbus.server')
+# ModbusSlaveContext and the register blocks are provided by the shim classes below
+ModbusServerContext = _resolve('ModbusServerContext', 'pymodbus.datastore')
+
+# Precompiled packers for float_to_registers
+_PACK_F = struct.Struct('>f').pack
+_UNPACK_HH = struct.Struct('>HH').unpack
+
+# ADL400 Register Map: (addr, type, name, default value)
+_REGISTERS = (
+    # Voltage Registers (Input Registers - FC 04)
+    (0, "IR", "Phase A Voltage (U V)", 0x4368),  # 230.0
+    (1, "IR", "Phase A Voltage (U V) LSW", 0x0000),
+    (2, "IR", "Phase B Voltage (U V)", 0x4368),
+    (3, "IR", "Phase B Voltage (U V) LSW", 0x0000),
+    (4, "IR", "Phase C Voltage (U V)", 0x4368),
+    (5, "IR", "Phase C Voltage (U V) LSW", 0x0000),
+
+    # Current Registers (Input Registers - FC 04)
+    (6, "IR", "Phase A Current (I A)", 0x4120),  # 10.0
+    (7, "IR", "Phase A Current (I A) LSW", 0x0000),
+    (8, "IR", "Phase B Current (I A)", 0x4120),
+    (9, "IR", "Phase B Current (I A) LSW", 0x0000),
+    (10, "IR", "Phase C Current (I A)", 0x4120),
+    (11, "IR", "Phase C Current (I A) LSW", 0x0000),
+
+    # Active Power Registers (Input Registers - FC 04)
+    (12, "IR", "Phase A Active Power (W)", 0x4500),  # 2048.0
+    (13, "IR", "Phase A Active Power (W) LSW", 0x0000),
+    (14, "IR", "Phase B Active Power (W)", 0x4500),
+    (15, "IR", "Phase B Active Power (W) LSW", 0x0000),
+    (16, "IR", "Phase C Active Power (W)", 0x4500),
+    (17, "IR", "Phase C Active Power (W) LSW", 0x0000),
+    (18, "IR", "Total Active Power (W)", 0x4500),
+    (19, "IR", "Total Active Power (W) LSW", 0x0000),
+
+    # Reactive Power Registers
+    (20, "IR", "Total Reactive Power (Var)", 0x4480),
+    (21, "IR", "Total Reactive Power (Var) LSW", 0x0000),
+
+    # Apparent Power Registers
+    (22, "IR", "Total Apparent Power (VA)", 0x4500),
+    (23, "IR", "Total Apparent Power (VA) LSW", 0x0000),
+
+    # Power Factor
+    (24, "IR", "Total Power Factor", 0x3F76),  # 0.95
+    (25, "IR", "Total Power Factor LSW", 0x0000),
+
+    # Frequency
+    (26, "IR", "Frequency (Hz)", 0x4248),  # 50.0
+    (27, "IR", "Frequency (Hz) LSW", 0x0000),
+
+    # Energy Registers (Input Registers - FC 04)
+    (34, "IR", "Total Active Energy (kWh)", 0x0000),  # 32-bit
+    (35, "IR", "Total Active Energy (kWh) LSW", 0x03E8),  # 1000
+
+    (36, "IR", "Total Reactive Energy (kVarh)", 0x0000),
+    (37, "IR", "Total Reactive Energy (kVarh) LSW", 0x0000),
+
+    # Status and Configuration Registers (Holding Registers - FC 03)
+    (100, "HR", "Device Address", 0x0001),
+    (101, "HR", "Baud Rate (0=9600,1=19200,2=38400)", 0x0000),
+    (102, "HR", "Power on Times", 0x0000),
+    (103, "HR", "Device Status", 0x0000),
+)
+_REG_BY_ADDR = {reg[0]: reg for reg in _REGISTERS}
+
+# Lines kept in the GUI log before the oldest are trimmed
+LOG_MAX_LINES = 2000
+
+# Display strings for every 16-bit register value, indexed by value
+_HEX4 = tuple(f"0x{v:04X}" for v in range(0x10000))
 
 
 class TextHandler(logging.Handler):
-    def __init__(self, text_widget):
+    """
+    Buffers formatted records for the GUI log.
+    emit() never touches Tk; the app drains `records` from the main loop.
+    """
+    def __init__(self, text_widget, maxlen=2000):
         super().__init__()
         self.text_widget = text_widget
         self.text_widget.tag_config("RX", foreground="blue")
         self.text_widget.tag_config("TX", foreground="green")
         self.text_widget.tag_config("ERR", foreground="red")
         self.text_widget.tag_config("INFO", foreground="black")
+        # Bounded so a chatty bus can't grow memory between drains
+        self.records = collections.deque(maxlen=maxlen)
+
+    # One scan classifies the record; group index -> tag (Device 100 spam is dropped by _DropDevice100)
+    _PAT = re.compile(
+        r"(Received|(?i:recv))"
+        r"|(Sending|(?i:send))"
+        r"|(Error|Exception)"
+    )
+    _TAGS = (None, "RX", "TX", "ERR")
 
     def emit(self, record):
+        m = self._PAT.search(record.getMessage())
+        tag = self._TAGS[m.lastindex] if m else "INFO"
+
         msg = self.format(record)
-        
-        # FILTER: Prevent performance degradation from Device 100 spam
-        if "requested device id does not exist: 100" in msg:
-            return
-        
-        # Simple color coding based on content
-        tag = "INFO"
-        if "Received" in msg or "recv" in msg.lower():
-            tag = "RX"
-        elif "Sending" in msg or "send" in msg.lower():
-            tag = "TX"
-        elif "Error" in msg or "Exception" in msg:
-            tag = "ERR"
-            
-        def append():
-            self.text_widget.configure(state='normal')
-            self.text_widget.insert('end', msg + '\n', tag)
-            self.text_widget.see('end')
-            self.text_widget.configure(state='disabled')
             
-        # Ensure thread safety for GUI updates
-        self.text_widget.after(0, append)
+        # deque.append is thread-safe; the GUI side drains it periodically
+        self.records.append((msg, tag))
+
+
+class FastFormatter(logging.Formatter):
+    """Formatter that runs strftime at most once per second (datefmt has no sub-second fields)"""
+    def __init__(self, fmt=None, datefmt='%H:%M:%S'):
+        super().__init__(fmt, datefmt)
+        self._time_cache = (None, '')  # (epoch second, formatted) swapped as one tuple for thread safety
+
+    def formatTime(self, record, datefmt=None):
+        sec = int(record.created)
+        cached_sec, cached_str = self._time_cache
+        if sec != cached_sec:
+            cached_str = time.strftime(datefmt or self.datefmt, self.converter(sec))
+            self._time_cache = (sec, cached_str)
+        return cached_str
+
+
+class _DropDevice100(logging.Filter):
+    """Reject pymodbus 'device id 100' spam at the GUI handler, before its formatter runs"""
+    def filter(self, record):
+        return 'does not exist: 100' not in record.getMessage()
 
 
 # --- Custom ModbusSlaveContext to fix v3.x compatibility ---
@@ -147,6 +165,8 @@ class ModbusSlaveContext:
     Shim class to replace the missing ModbusSlaveContext in Pymodbus v3.x.
     It wraps the 4 data blocks (di, co, hr, ir) and provides the required interface.
     """
+    __slots__ = ('store', 'zero_mode', '_blocks')
+
     def __init__(self, di=None, co=None, hr=None, ir=None, zero_mode=False):
         self.store = {}
         if di: self.store['d'] = di
@@ -155,6 +175,14 @@ class ModbusSlaveContext:
         if ir: self.store['i'] = ir
         self.zero_mode = zero_mode
 
+        # Function code -> block, indexed directly (None = unsupported fx)
+        blocks = [None] * 17
+        blocks[1] = blocks[5] = blocks[15] = co
+        blocks[2] = di
+        blocks[3] = blocks[6] = blocks[16] = hr
+        blocks[4] = ir
+        self._blocks = tuple(blocks)
+
     def __str__(self):
         return "ModbusSlaveContext"
 
@@ -163,39 +191,34 @@ class ModbusSlaveContext:
             block.reset()
 
     def validate(self, fx, address, count=1):
-        if fx in [1, 5, 15]: block = self.store.get('c')
-        elif fx in [2]:      block = self.store.get('d')
-        elif fx in [3, 6, 16]: block = self.store.get('h')
-        elif fx in [4]:      block = self.store.get('i')
-        else: return False
-        
-        if not block: return False
+        try: block = self._blocks[fx]
+        except IndexError: return False
+        if block is None: return False
         return block.validate(address, count)
 
     def getValues(self, fx, address, count=1):
-        if fx in [1, 5, 15]: block = self.store.get('c')
-        elif fx in [2]:      block = self.store.get('d')
-        elif fx in [3, 6, 16]: block = self.store.get('h')
-        elif fx in [4]:      block = self.store.get('i')
-        else: return []
-        
-        vals = block.getValues(address, count)
-        return vals
+        try: block = self._blocks[fx]
+        except IndexError: return []
+        if block is None: return []
+        return block.getValues(address, count)
 
     def setValues(self, fx, address, values):
-        if fx in [1, 5, 15]: block = self.store.get('c')
-        elif fx in [2]:      block = self.store.get('d')
-        elif fx in [3, 6, 16]: block = self.store.get('h')
-        elif fx in [4]:      block = self.store.get('i')
-        else: return
-        
-        block.setValues(address, values)
+        try: block = self._blocks[fx]
+        except IndexError: return
+        if block is None: return
+        return block.setValues(address, values)
         
+    # pymodbus awaits these on every request; lookups are inlined to skip the extra sync call
     async def async_getValues(self, fx, address, count=1):
-        return self.getValues(fx, address, count)
+        try: block = self._blocks[fx]
+        except IndexError: return []
+        return block.getValues(address, count) if block is not None else []
         
     async def async_setValues(self, fx, address, values):
-        return self.setValues(fx, address, values)
+        try: block = self._blocks[fx]
+        except IndexError: return
+        # An ExcCodes result (e.g. ILLEGAL_ADDRESS) becomes the exception response
+        if block is not None: return block.setValues(address, values)
 
 
 class EnergyMeterSimulatorApp:
@@ -204,29 +227,51 @@ class EnergyMeterSimulatorApp:
         self.root.title("Energy Meter Simulator (ADL400 - Modbus RTU Slave) - v3.11.4")
         self.root.geometry("1000x900")
 
-        self.server_thread = None
         self.stop_server_event = threading.Event()
+        # One long-lived asyncio loop hosts every server run; start/stop just submit work to it
+        self._bg_loop = asyncio.new_event_loop()
+        threading.Thread(target=self._bg_loop.run_forever, daemon=True, name="ModbusLoop").start()
+        self._server_fut = None
+        self._async_stop = None  # Created by run_async_server(), set by stop_server()
         self.context = None
         self.store = None
+        # Live register values (addr -> int); _REGISTERS only holds the defaults
+        self.reg_values = {addr: val for addr, _, _, val in _REGISTERS}
+        self._last_ports = ()  # Port list currently shown in the combobox
+        # Tree rows waiting for the next idle flush
+        self._pending_rows = set()
+        self._flush_scheduled = False
 
         self.setup_ui()
+        self._setup_logging()
+        self._drain_log()
         
-        # Setup Logging to GUI
+        # Check imports availability
+        for err in _import_errors:
+            self.my_log(f"Import: {err}")
+        if not ModbusSerialServer:
+            self.my_log("ERROR: Could not import Pymodbus Server function. Check version.")
+
+    def _setup_logging(self):
+        """Route the pymodbus and SimApp loggers to the GUI log handler"""
         self.logger = logging.getLogger("pymodbus")
-        self.logger.setLevel(logging.INFO)
+        # Quiet by default; toggle_traffic() raises it to DEBUG on demand
+        self.logger.setLevel(logging.WARNING)
         self.logger.handlers = []
+        self.logger.propagate = False  # GUI handler only; no second pass through root
         
         self.log_handler = TextHandler(self.log_text)
-        self.log_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s', '%H:%M:%S'))
+        self.log_handler.setFormatter(FastFormatter('%(asctime)s - %(message)s', '%H:%M:%S'))
+        # On the handler, not the logger: pymodbus logs through the child "pymodbus.logging",
+        # and a logger's filters don't see records propagated up from its children
+        self.log_handler.addFilter(_DropDevice100())
         self.logger.addHandler(self.log_handler)
         
         self.my_logger = logging.getLogger("SimApp")
         self.my_logger.setLevel(logging.INFO)
+        self.my_logger.handlers = []
+        self.my_logger.propagate = False
         self.my_logger.addHandler(self.log_handler)
-        
-        # Check imports availability
-        if not StartAsyncSerialServer and not StartSerialServer:
-            self.my_log("ERROR: Could not import Pymodbus Server function. Check version.")
 
     def my_log(self, msg):
         self.my_logger.info(msg)
@@ -235,6 +280,34 @@ class EnergyMeterSimulatorApp:
         """Simple internal log"""
         self.my_log(msg)
 
+    def _drain_log(self):
+        """Flush buffered log records into the Text widget (runs on the Tk thread)"""
+        records = self.log_handler.records
+        if records:
+            # Merge consecutive records with the same tag, then insert all in one Tcl call
+            segments = []
+            chunk, chunk_tag = [], None
+            while records:
+                msg, tag = records.popleft()
+                if tag != chunk_tag and chunk:
+                    segments += ('\n'.join(chunk) + '\n', chunk_tag)
+                    chunk = []
+                chunk.append(msg)
+                chunk_tag = tag
+            segments += ('\n'.join(chunk) + '\n', chunk_tag)
+
+            self.log_text.configure(state='normal')
+            self.log_text.insert('end', *segments)
+            # Tk's Text widget slows down past a few thousand lines; trim the oldest
+            excess = int(self.log_text.index('end-1c').split('.')[0]) - LOG_MAX_LINES
+            if excess > 0:
+                self.log_text.delete('1.0', f'{excess + 1}.0')
+            # One scroll per drain tick, however many lines arrived
+            self.log_text.see('end')
+            self.log_text.configure(state='disabled')
+
+        self.root.after(100, self._drain_log)
+
     def setup_ui(self):
         # Configuration Frame
         config_frame = ttk.LabelFrame(self.root, text="Configuration", padding="10")
@@ -317,64 +390,6 @@ class EnergyMeterSimulatorApp:
         # Data Frame
         data_frame = ttk.LabelFrame(self.root, text="ADL400 Modbus Registers", padding="10")
         data_frame.pack(fill="both", expand=True, padx=10, pady=5)
-
-        # ADL400 Register Map
-        self.register_map = [
-            # Voltage Registers (Input Registers - FC 04)
-            {"addr": 0, "name": "Phase A Voltage (U V)", "val": 0x4368, "type": "IR"},  # 230.0
-            {"addr": 1, "name": "Phase A Voltage (U V) LSW", "val": 0x0000, "type": "IR"},
-            {"addr": 2, "name": "Phase B Voltage (U V)", "val": 0x4368, "type": "IR"},
-            {"addr": 3, "name": "Phase B Voltage (U V) LSW", "val": 0x0000, "type": "IR"},
-            {"addr": 4, "name": "Phase C Voltage (U V)", "val": 0x4368, "type": "IR"},
-            {"addr": 5, "name": "Phase C Voltage (U V) LSW", "val": 0x0000, "type": "IR"},
-            
-            # Current Registers (Input Registers - FC 04)
-            {"addr": 6, "name": "Phase A Current (I A)", "val": 0x4120, "type": "IR"},  # 10.0
-            {"addr": 7, "name": "Phase A Current (I A) LSW", "val": 0x0000, "type": "IR"},
-            {"addr": 8, "name": "Phase B Current (I A)", "val": 0x4120, "type": "IR"},
-            {"addr": 9, "name": "Phase B Current (I A) LSW", "val": 0x0000, "type": "IR"},
-            {"addr": 10, "name": "Phase C Current (I A)", "val": 0x4120, "type": "IR"},
-            {"addr": 11, "name": "Phase C Current (I A) LSW", "val": 0x0000, "type": "IR"},
-            
-            # Active Power Registers (Input Registers - FC 04)
-            {"addr": 12, "name": "Phase A Active Power (W)", "val": 0x4500, "type": "IR"},  # 2048.0
-            {"addr": 13, "name": "Phase A Active Power (W) LSW", "val": 0x0000, "type": "IR"},
-            {"addr": 14, "name": "Phase B Active Power (W)", "val": 0x4500, "type": "IR"},
-            {"addr": 15, "name": "Phase B Active Power (W) LSW", "val": 0x0000, "type": "IR"},
-            {"addr": 16, "name": "Phase C Active Power (W)", "val": 0x4500, "type": "IR"},
-            {"addr": 17, "name": "Phase C Active Power (W) LSW", "val": 0x0000, "type": "IR"},
-            {"addr": 18, "name": "Total Active Power (W)", "val": 0x4500, "type": "IR"},
-            {"addr": 19, "name": "Total Active Power (W) LSW", "val": 0x0000, "type": "IR"},
-            
-            # Reactive Power Registers
-            {"addr": 20, "name": "Total Reactive Power (Var)", "val": 0x4480, "type": "IR"},
-            {"addr": 21, "name": "Total Reactive Power (Var) LSW", "val": 0x0000, "type": "IR"},
-            
-            # Apparent Power Registers
-            {"addr": 22, "name": "Total Apparent Power (VA)", "val": 0x4500, "type": "IR"},
-            {"addr": 23, "name": "Total Apparent Power (VA) LSW", "val": 0x0000, "type": "IR"},
-            
-            # Power Factor
-            {"addr": 24, "name": "Total Power Factor", "val": 0x3F76, "type": "IR"},  # 0.95
-            {"addr": 25, "name": "Total Power Factor LSW", "val": 0x0000, "type": "IR"},
-            
-            # Frequency
-            {"addr": 26, "name": "Frequency (Hz)", "val": 0x4248, "type": "IR"},  # 50.0
-            {"addr": 27, "name": "Frequency (Hz) LSW", "val": 0x0000, "type": "IR"},
-            
-            # Energy Registers (Input Registers - FC 04)
-            {"addr": 34, "name": "Total Active Energy (kWh)", "val": 0x00000000, "type": "IR"},  # 32-bit
-            {"addr": 35, "name": "Total Active Energy (kWh) LSW", "val": 0x03E8, "type": "IR"},  # 1000
-            
-            {"addr": 36, "name": "Total Reactive Energy (kVarh)", "val": 0x00000000, "type": "IR"},
-            {"addr": 37, "name": "Total Reactive Energy (kVarh) LSW", "val": 0x0000, "type": "IR"},
-            
-            # Status and Configuration Registers (Holding Registers - FC 03)
-            {"addr": 100, "name": "Device Address", "val": 0x0001, "type": "HR"},
-            {"addr": 101, "name": "Baud Rate (0=9600,1=19200,2=38400)", "val": 0x0000, "type": "HR"},
-            {"addr": 102, "name": "Power on Times", "val": 0x0000, "type": "HR"},
-            {"addr": 103, "name": "Device Status", "val": 0x0000, "type": "HR"},
-        ]
         
         # Table
         self.tree = ttk.Treeview(data_frame, columns=("Address", "Type", "Name", "Value"), show="headings", height=20)
@@ -394,9 +409,8 @@ class EnergyMeterSimulatorApp:
         self.tree.configure(yscrollcommand=scrollbar.set)
 
         # Initialize Data Rows
-        for reg in self.register_map:
-            self.tree.insert("", "end", iid=reg["addr"], 
-                           values=(reg["addr"], reg["type"], reg["name"], f"0x{reg['val']:04X}"))
+        for addr, reg_type, name, val in _REGISTERS:
+            self.tree.insert("", "end", iid=addr, values=(addr, reg_type, name, _HEX4[val]))
 
         # Edit Value
         edit_frame = ttk.Frame(data_frame)
@@ -421,27 +435,24 @@ class EnergyMeterSimulatorApp:
             self.logger.setLevel(logging.DEBUG)
             self.my_log("Traffic Logging ENABLED")
         else:
-            self.logger.setLevel(logging.INFO)
+            self.logger.setLevel(logging.WARNING)
             self.my_log("Traffic Logging DISABLED")
 
     def float_to_registers(self, value):
         """Pack float as Big Endian, return (MSW, LSW)"""
-        b = struct.pack('>f', value)
-        regs = struct.unpack('>HH', b)
-        return regs[0], regs[1]  # MSW, LSW
+        return _UNPACK_HH(_PACK_F(value))
 
     def uint32_to_registers(self, value):
-        """Pack Uint32 as Big Endian, return (MSW, LSW)"""
-        b = struct.pack('>I', value)
-        regs = struct.unpack('>HH', b)
-        return regs[0], regs[1]  # MSW, LSW
+        """Split Uint32 into (MSW, LSW) with plain int ops"""
+        if not 0 <= value <= 0xFFFFFFFF:
+            raise ValueError(f"{value} out of Uint32 range")
+        return value >> 16, value & 0xFFFF
 
     def set_voltage_a(self):
         try:
             val = self.voltage_a_var.get()
             msw, lsw = self.float_to_registers(val)
-            self.update_register_direct(0, msw) 
-            self.update_register_direct(1, lsw)
+            self.update_register_pair(0, msw, lsw)
             self.log(f"✓ Set Phase A Voltage to {val}V (0=0x{msw:04X}, 1=0x{lsw:04X})")
         except Exception as e:
             messagebox.showerror("Error", f"Invalid Float: {e}")
@@ -450,8 +461,7 @@ class EnergyMeterSimulatorApp:
         try:
             val = self.current_a_var.get()
             msw, lsw = self.float_to_registers(val)
-            self.update_register_direct(6, msw)
-            self.update_register_direct(7, lsw)
+            self.update_register_pair(6, msw, lsw)
             self.log(f"✓ Set Phase A Current to {val}A (6=0x{msw:04X}, 7=0x{lsw:04X})")
         except Exception as e:
             messagebox.showerror("Error", f"Invalid Float: {e}")
@@ -460,8 +470,7 @@ class EnergyMeterSimulatorApp:
         try:
             val = self.power_var.get()
             msw, lsw = self.float_to_registers(val)
-            self.update_register_direct(18, msw)
-            self.update_register_direct(19, lsw)
+            self.update_register_pair(18, msw, lsw)
             self.log(f"✓ Set Total Active Power to {val}W (18=0x{msw:04X}, 19=0x{lsw:04X})")
         except Exception as e:
             messagebox.showerror("Error", f"Invalid Float: {e}")
@@ -470,8 +479,7 @@ class EnergyMeterSimulatorApp:
         try:
             val = self.frequency_var.get()
             msw, lsw = self.float_to_registers(val)
-            self.update_register_direct(26, msw)
-            self.update_register_direct(27, lsw)
+            self.update_register_pair(26, msw, lsw)
             self.log(f"✓ Set Frequency to {val}Hz (26=0x{msw:04X}, 27=0x{lsw:04X})")
         except Exception as e:
             messagebox.showerror("Error", f"Invalid Float: {e}")
@@ -480,8 +488,7 @@ class EnergyMeterSimulatorApp:
         try:
             val = self.energy_var.get()
             msw, lsw = self.uint32_to_registers(val)
-            self.update_register_direct(34, msw)
-            self.update_register_direct(35, lsw)
+            self.update_register_pair(34, msw, lsw)
             self.log(f"✓ Set Total Active Energy to {val}kWh (34=0x{msw:04X}, 35=0x{lsw:04X})")
         except Exception as e:
             messagebox.showerror("Error", f"Invalid Integer: {e}")
@@ -490,20 +497,43 @@ class EnergyMeterSimulatorApp:
         try:
             val = self.pf_var.get()
             msw, lsw = self.float_to_registers(val)
-            self.update_register_direct(24, msw)
-            self.update_register_direct(25, lsw)
+            self.update_register_pair(24, msw, lsw)
             self.log(f"✓ Set Power Factor to {val} (24=0x{msw:04X}, 25=0x{lsw:04X})")
         except Exception as e:
             messagebox.showerror("Error", f"Invalid Float: {e}")
 
+    def _update_tree_row(self, addr, val):
+        if addr in self.reg_values:
+            # Keep the live values current so a later start_server() seeds the edited value
+            self.reg_values[addr] = val
+            # Defer the Treeview write; many updates collapse into one idle flush
+            self._pending_rows.add(addr)
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                self.root.after_idle(self._flush_tree)
+
+    def _flush_tree(self):
+        self._flush_scheduled = False
+        values = self.reg_values
+        for addr in self._pending_rows:
+            _, reg_type, name, _ = _REG_BY_ADDR[addr]
+            self.tree.item(addr, values=(addr, reg_type, name, _HEX4[values[addr]]))
+        self._pending_rows.clear()
+
+    def update_register_pair(self, addr, msw, lsw):
+        """Update a 32-bit value (MSW at addr, LSW at addr+1) with a single store write"""
+        self._update_tree_row(addr, msw)
+        self._update_tree_row(addr + 1, lsw)
+
+        # Only the block matching the register type is served for these addresses
+        if self.store:
+            fx = 3 if _REG_BY_ADDR[addr][1] == 'HR' else 4
+            self.store.setValues(fx, addr, [msw, lsw])
+
     def update_register_direct(self, addr, val):
         """Update both GUI and Modbus stores (HR + IR)"""
         # Update Tree
-        if self.tree.exists(addr):
-            item = self.tree.item(addr)
-            reg_type = item['values'][1]
-            name = item['values'][2]
-            self.tree.item(addr, values=(addr, reg_type, name, f"0x{val:04X}"))
+        self._update_tree_row(addr, val)
         
         # Update BOTH Modbus Stores
         if self.store:
@@ -511,17 +541,18 @@ class EnergyMeterSimulatorApp:
             self.store.setValues(4, addr, [val])  # Input Registers (FC 04)
 
     def refresh_ports(self):
-        ports = serial.tools.list_ports.comports()
-        self.com_port_combo['values'] = [p.device for p in ports]
-        if ports:
+        devices = tuple(p.device for p in serial.tools.list_ports.comports())
+        if devices == self._last_ports:
+            return  # Nothing changed; keep the widget and the user's selection as-is
+        self._last_ports = devices
+        self.com_port_combo['values'] = devices
+        if devices and self.com_port_var.get() not in devices:
             self.com_port_combo.current(0)
 
     def on_tree_select(self, event):
         selected_item = self.tree.selection()
         if selected_item:
-            item = self.tree.item(selected_item)
-            val_str = item['values'][3]
-            self.edit_val_var.set(val_str)
+            self.edit_val_var.set(_HEX4[self.reg_values[int(selected_item[0])]])
 
     def update_register(self):
         """Manual register update from GUI"""
@@ -555,24 +586,25 @@ class EnergyMeterSimulatorApp:
             
             self.my_log(f"Starting Modbus RTU Server on {port} @ {baudrate} baud, Slave ID {slave_id}...")
             
+            # Initialize register values from GUI (baked into the blocks up front)
+            hr_initial = array.array('H', bytes(2 * 150))
+            ir_initial = array.array('H', bytes(2 * 150))
+            for addr, reg_type, _name, _default in _REGISTERS:
+                (ir_initial if reg_type == 'IR' else hr_initial)[addr] = self.reg_values[addr]
+            
             # Create Modbus Datastore
-            hr_block = ModbusSequentialDataBlock(0, [0] * 150)
-            ir_block = ModbusSequentialDataBlock(0, [0] * 150)
+            hr_block = RegisterArrayBlock(0, hr_initial)
+            ir_block = RegisterArrayBlock(0, ir_initial)
             
             self.store = ModbusSlaveContext(hr=hr_block, ir=ir_block)
             
-            # Initialize register values from GUI
-            for reg in self.register_map:
-                self.store.setValues(3 if reg['type'] == 'HR' else 4, reg['addr'], [reg['val']])
-            
             # Create Server Context
-            slaves = {slave_id: self.store}
-            self.context = ModbusServerContext(slaves=slaves, single=False)
+            self.context = ModbusServerContext(devices={slave_id: self.store}, single=False)
             
-            # Start Server in Thread
+            # Start Server on the background loop
             self.stop_server_event.clear()
-            self.server_thread = threading.Thread(target=self.run_server, args=(port, baudrate, slave_id), daemon=True)
-            self.server_thread.start()
+            self._server_fut = asyncio.run_coroutine_threadsafe(
+                self.run_async_server(port, baudrate, slave_id), self._bg_loop)
             
             self.start_btn.config(state="disabled")
             self.stop_btn.config(state="normal")
@@ -582,43 +614,32 @@ class EnergyMeterSimulatorApp:
             messagebox.showerror("Error", f"Failed to start server: {e}")
             self.my_log(f"✗ Error: {e}")
 
-    def run_server(self, port, baudrate, slave_id):
-        """Run Modbus server (blocking)"""
-        try:
-            if StartAsyncSerialServer:
-                # Async server (preferred for v3.6+)
-                asyncio.run(self.run_async_server(port, baudrate, slave_id))
-            elif StartSerialServer:
-                # Sync server (fallback)
-                StartSerialServer(
-                    context=self.context,
-                    port=port,
-                    baudrate=baudrate,
-                    timeout=1.0,
-                    ignore_missing_slaves=True
-                )
-            else:
-                self.my_log("ERROR: No server start function available!")
-        except Exception as e:
-            self.my_log(f"Server error: {e}")
-
     async def run_async_server(self, port, baudrate, slave_id):
         """Async Modbus server"""
+        self._async_stop = asyncio.Event()
+        if self.stop_server_event.is_set():
+            return  # Stop was requested before the loop existed
         try:
-            server = await StartAsyncSerialServer(
-                context=self.context,
+            server = ModbusSerialServer(
+                self.context,
                 port=port,
                 baudrate=baudrate,
                 timeout=1.0,
                 ignore_missing_slaves=True
             )
+            serve_task = asyncio.ensure_future(server.serve_forever())
+            stop_task = asyncio.ensure_future(self._async_stop.wait())
             
-            # Keep server running until stop is requested
-            while not self.stop_server_event.is_set():
-                await asyncio.sleep(0.1)
-            
-            if hasattr(server, 'close'):
-                server.close()
+            # Sleep (no polling) until the server exits or stop_server() sets the event
+            done, _ = await asyncio.wait((serve_task, stop_task), return_when=asyncio.FIRST_COMPLETED)
+            stop_task.cancel()
+            if serve_task in done:
+                serve_task.result()  # Surface startup errors (e.g. port busy)
+            else:
+                # Cancelling serve_forever() alone leaves the serial transport open (it swallows
+                # the CancelledError); shutdown() closes the port and ends serve_forever()
+                await server.shutdown()
+                await asyncio.gather(serve_task, return_exceptions=True)
         except Exception as e:
             self.my_log(f"Async server error: {e}")
 
@@ -627,9 +648,15 @@ class EnergyMeterSimulatorApp:
         try:
             self.my_log("Stopping server...")
             self.stop_server_event.set()
+            if self._async_stop is not None:
+                self._bg_loop.call_soon_threadsafe(self._async_stop.set)
             
-            if self.server_thread and self.server_thread.is_alive():
-                self.server_thread.join(timeout=2)
+            if self._server_fut is not None:
+                try:
+                    self._server_fut.result(timeout=2)
+                except concurrent.futures.TimeoutError:
+                    self.my_log("⚠ Server did not stop within 2s")
+                self._server_fut = None
             
             self.my_log("✓ Server stopped")
             self.start_btn.config(state="normal")
@@ -3,129 +3,126 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import threading
 import logging
+import logging.handlers
 import asyncio
+import queue
+import collections
+import time
+import importlib
 import serial.tools.list_ports
 
-# Robust Imports for Pymodbus v3.x
-import sys
-import importlib.util
-print(f"Debug: Pymodbus import check...")
-
-# Check Serial Dependency
-try:
-    import serial
-    print(f"Debug: serial imported from {serial.__file__}")
-except ImportError as e:
-    print(f"Debug: FAILED to import serial: {e}")
-
-StartSerialServer = None
-StartAsyncSerialServer = None
-ModbusSerialServer = None
-
-try:
-    import pymodbus.server
-    print(f"Debug: pymodbus.server dir: {dir(pymodbus.server)}")
-except ImportError as e:
-    print(f"Debug: Failed to import pymodbus.server module: {e}")
-
-try:
-    from pymodbus.server import StartSerialServer
-    print("Debug: Imported StartSerialServer")
-except ImportError as e:
-    print(f"Debug: Failed to import StartSerialServer: {e}")
-
-try:
-    from pymodbus.server import StartAsyncSerialServer
-    print("Debug: Imported StartAsyncSerialServer")
-except ImportError as e:
-    print(f"Debug: Failed to import StartAsyncSerialServer: {e}")
-
-try:
-    # Fallback to class directly
-    from pymodbus.server import ModbusSerialServer
-    print("Debug: Imported ModbusSerialServer")
-except ImportError as e:
-    print(f"Debug: Failed to import ModbusSerialServer: {e}")
-
-try:
-    from pymodbus.device import ModbusDeviceIdentification
-except ImportError:
-    ModbusDeviceIdentification = None
-
-# Datastore Imports - Try multiple locations
-ModbusServerContext = None
-ModbusSlaveContext = None
-ModbusSequentialDataBlock = None
-
-try:
-    from pymodbus.datastore import ModbusServerContext, ModbusSlaveContext, ModbusSequentialDataBlock
-    print("Debug: Imported Datastore classes directly")
-except ImportError:
-    # Try submodules
-    try:
-        from pymodbus.datastore import ModbusServerContext
-    except ImportError: pass
-    
-    try:
-        from pymodbus.datastore import ModbusSlaveContext
-    except ImportError:
-        try: from pymodbus.datastore.context import ModbusSlaveContext
-        except ImportError: pass
+from register_blocks import RegisterArrayBlock, BitArrayBlock
 
-    try:
-        from pymodbus.datastore import ModbusSequentialDataBlock
-    except ImportError:
-        try: from pymodbus.datastore.store import ModbusSequentialDataBlock
-        except ImportError: pass
-
-try:
-    from pymodbus.framer import ModbusRtuFramer
-except ImportError:
-    try:
-        from pymodbus.transaction import ModbusRtuFramer
-    except ImportError:
-        ModbusRtuFramer = None
+# Pymodbus symbols, resolved lazily on first use (see _resolve_pymodbus); missing ones map to None
+_PM = {}
 
-# Configure logging
-logging.basicConfig()
+def _first_attr(attr, *modules):
+    for name in modules:
+        try:
+            return getattr(importlib.import_module(name), attr)
+        except (ImportError, AttributeError):
+            log.debug("pymodbus: %s not in %s", attr, name)
+    return None
+
+def _resolve_pymodbus():
+    """Fill _PM once, with fallbacks for the names that moved between pymodbus 3.x releases"""
+    if _PM:
+        return _PM
+    for attr in ('StartSerialServer', 'StartAsyncSerialServer', 'ServerAsyncStop'):
+        _PM[attr] = _first_attr(attr, 'pymodbus.server')
+    _PM['ModbusDeviceIdentification'] = _first_attr('ModbusDeviceIdentification', 'pymodbus', 'pymodbus.device')
+    _PM['ModbusServerContext'] = _first_attr('ModbusServerContext', 'pymodbus.datastore')
+    # ModbusSlaveContext was renamed ModbusDeviceContext in 3.10
+    _PM['ModbusSlaveContext'] = (_first_attr('ModbusSlaveContext', 'pymodbus.datastore', 'pymodbus.datastore.context')
+                                 or _first_attr('ModbusDeviceContext', 'pymodbus.datastore'))
+    # Framer classes were replaced by the FramerType enum
+    framer_type = _first_attr('FramerType', 'pymodbus', 'pymodbus.framer')
+    _PM['RtuFramer'] = (framer_type.RTU if framer_type is not None
+                        else _first_attr('ModbusRtuFramer', 'pymodbus.framer', 'pymodbus.transaction'))
+    return _PM
+
+# Configure logging (no basicConfig: the GUI's QueueHandler is root's only handler, see __init__)
 log = logging.getLogger()
+log.handlers.clear()
 log.setLevel(logging.INFO)
 
 import struct
+import array
+
+# Precompiled big-endian packers: value -> 4 bytes -> (word at addr, word at addr+1)
+_F = struct.Struct('>f')
+_I = struct.Struct('>I')
+_HH = struct.Struct('>HH')
+
+def _crc_entry(b):
+    # One byte through the reflected Modbus polynomial (0xA001)
+    for _ in range(8):
+        b = (b >> 1) ^ 0xA001 if b & 1 else b >> 1
+    return b
+
+_CRC_TABLE = array.array('H', [_crc_entry(b) for b in range(256)])
+
+def crc16_modbus(buf, tbl=_CRC_TABLE):
+    """Modbus RTU CRC16 of buf (bytes-like); the frame carries it low byte first"""
+    c = 0xFFFF
+    for b in buf:
+        c = (c >> 8) ^ tbl[(c ^ b) & 0xFF]
+    return c
 
 # ... (Previous imports)
 
 # ... imports
 
 class TextHandler(logging.Handler):
+    """QueueListener target: tags records off-thread, the Tk loop inserts them in batches"""
     def __init__(self, text_widget):
         super().__init__()
         self.text_widget = text_widget
+        self.pending = collections.deque()
         self.text_widget.tag_config("RX", foreground="blue")
         self.text_widget.tag_config("TX", foreground="green")
         self.text_widget.tag_config("ERR", foreground="red")
         self.text_widget.tag_config("INFO", foreground="black")
 
+    # pymodbus traffic traces start with "recv:"/"send:" (older releases: "Received"/"Sending")
+    _RX = ("recv", "Recv", "RECV")
+    _TX = ("send", "Send", "SEND")
+
     def emit(self, record):
-        msg = self.format(record)
-        
-        # Simple color coding based on content
-        tag = "INFO"
-        if "Received" in msg or "recv" in msg.lower():
-            tag = "RX"
-        elif "Sending" in msg or "send" in msg.lower():
-            tag = "TX"
-        elif "Error" in msg or "Exception" in msg:
+        # Color coding from level / logger name / raw message prefix; format only after tagging
+        if record.levelno >= logging.ERROR:
             tag = "ERR"
-            
-        def append():
-            self.text_widget.configure(state='normal')
-            self.text_widget.insert('end', msg + '\n', tag)
-            self.text_widget.see('end')
-            self.text_widget.configure(state='disabled')
-            
-        # Ensure thread safety for GUI updates
-        self.text_widget.after(0, append)
+        elif record.name.startswith("pymodbus") and isinstance(record.msg, str):
+            raw = record.msg
+            tag = "RX" if raw.startswith(self._RX) else "TX" if raw.startswith(self._TX) else "INFO"
+        else:
+            tag = "INFO"
+        msg = self.format(record)
+
+        # deque.append is atomic; only the main thread touches the widget (see drain)
+        self.pending.append((msg, tag))
+
+    def drain(self):
+        """Main thread only: flush everything pending with one insert call"""
+        pending = self.pending
+        if not pending:
+            return
+        # Merge consecutive same-tag records into one (text, tag) segment
+        segments = []
+        buf, cur = [], None
+        while pending:
+            msg, tag = pending.popleft()
+            if tag != cur and buf:
+                segments += ('\n'.join(buf) + '\n', cur)
+                buf = []
+            cur = tag
+            buf.append(msg)
+        segments += ('\n'.join(buf) + '\n', cur)
+
+        self.text_widget.configure(state='normal')
+        self.text_widget.insert('end', *segments)
+        self.text_widget.see('end')
+        self.text_widget.configure(state='disabled')
 
 class FlowMeterSimulatorApp:
     def __init__(self, root):
@@ -133,35 +130,88 @@ class FlowMeterSimulatorApp:
         self.root.title("Flow Meter Simulator (Modbus RTU Slave)")
         self.root.geometry("800x800")
 
-        self.server_thread = None
-        self.stop_server_event = threading.Event()
         self.context = None
         self.store = None
 
+        # One asyncio loop for the app's lifetime, pumped from the Tk mainloop (no server thread):
+        # the server, the datastore and the widgets are all touched from the main thread only
+        self._loop = asyncio.new_event_loop()
+        self._server_task = None
+        self.root.after(10, self._pump_loop)
+
+        # addr -> latest value, applied to the Treeview in one pass per ~frame
+        self._pending_tree = {}
+        self._flush_scheduled = False
+
+        # (monotonic timestamp, port device names); comports() is slow on Windows
+        self._ports_cache = None
+
         self.setup_ui()
         
         # Setup Logging to GUI
+        # Loggers only do a queue.put; a QueueListener thread formats/tags, Tk drains every 50ms
+        self._log_q = queue.SimpleQueue()
+        qh = logging.handlers.QueueHandler(self._log_q)
+        # Root only: everything (pymodbus, SimApp, module-level `log`) propagates here exactly once
+        log.addHandler(qh)
+
         self.logger = logging.getLogger("pymodbus")
         self.logger.setLevel(logging.INFO)
-        # Remove default handlers to avoid double printing if any
-        self.logger.handlers = []
+        self.logger.propagate = True
         
         self.log_handler = TextHandler(self.log_text)
         self.log_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s', '%H:%M:%S'))
-        self.logger.addHandler(self.log_handler)
+        self._listener = logging.handlers.QueueListener(self._log_q, self.log_handler, respect_handler_level=True)
+        self._listener.start()
         
         # Also redirect my own log
         self.my_logger = logging.getLogger("SimApp")
         self.my_logger.setLevel(logging.INFO)
-        self.my_logger.addHandler(self.log_handler)
+        self.my_logger.propagate = True
+
+        self._drain_log()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Check imports availability
-        if not StartAsyncSerialServer and not StartSerialServer:
-            self.my_log("ERROR: Could not import Pymodbus Server function. Check version.")
+        pm = _resolve_pymodbus()
+        if not pm['StartAsyncSerialServer'] and not pm['StartSerialServer']:
+            self.my_logger.error("ERROR: Could not import Pymodbus Server function. Check version.")
+
+        # Device identity is constant, build it once and reuse across server restarts
+        self._identity = None
+        if pm['ModbusDeviceIdentification']:
+            self._identity = pm['ModbusDeviceIdentification']()
+            self._identity.VendorName = 'Simulated Flow Meter'
+            self._identity.ProductCode = 'SFM'
+            self._identity.VendorUrl = 'http://github.com/pymodbus'
+            self._identity.ProductName = 'Flow Meter Server'
+            self._identity.ModelName = 'Modbus Server'
+            self._identity.MajorMinorRevision = '1.0'
 
     def my_log(self, msg):
         self.my_logger.info(msg)
 
+    def _drain_log(self):
+        self.log_handler.drain()
+        self.root.after(50, self._drain_log)
+
+    def _pump_loop(self):
+        # Run every ready asyncio callback once, then hand control back to Tk
+        self._loop.call_soon(self._loop.stop)
+        self._loop.run_forever()
+        self.root.after(10, self._pump_loop)
+
+    def on_close(self):
+        # Stop the server and the log listener before Tk goes away
+        if self._server_task is not None:
+            try:
+                self._loop.run_until_complete(asyncio.wait_for(self._shutdown(), 2))
+            except Exception:
+                pass
+        self._listener.stop()
+        self._loop.close()
+        self.root.destroy()
+
     def setup_ui(self):
         # Configuration Frame
         config_frame = ttk.LabelFrame(self.root, text="Configuration", padding="10")
@@ -173,7 +223,7 @@ class FlowMeterSimulatorApp:
         self.com_port_combo = ttk.Combobox(config_frame, textvariable=self.com_port_var)
         self.com_port_combo.grid(row=0, column=1, padx=5, pady=5)
         self.refresh_ports()
-        ttk.Button(config_frame, text="Refresh", command=self.refresh_ports).grid(row=0, column=2, padx=5, pady=5)
+        ttk.Button(config_frame, text="Refresh", command=lambda: self.refresh_ports(force=True)).grid(row=0, column=2, padx=5, pady=5)
 
         # Baudrate
         ttk.Label(config_frame, text="Baudrate:").grid(row=1, column=0, padx=5, pady=5)
@@ -226,17 +276,24 @@ class FlowMeterSimulatorApp:
 
         # Register Map from FlowMeter.h
         self.register_map = [
-            {"addr": 772, "name": "Forward Total (Low Word)", "val": 0},
-            {"addr": 773, "name": "Forward Total (High Word)", "val": 0},
+            {"addr": 772, "name": "Forward Total (Word 0 - MSW)", "val": 0},
+            {"addr": 773, "name": "Forward Total (Word 1 - LSW)", "val": 0},
             {"addr": 774, "name": "Unit Info", "val": 0},
             {"addr": 777, "name": "Alarm Flags", "val": 0},
-            {"addr": 778, "name": "Flow Rate (Low Word)", "val": 0},
-            {"addr": 779, "name": "Flow Rate (High Word)", "val": 0},
+            {"addr": 778, "name": "Flow Rate (Word 0 - MSW)", "val": 0},
+            {"addr": 779, "name": "Flow Rate (Word 1 - LSW)", "val": 0},
             {"addr": 786, "name": "Forward Overflow (Low)", "val": 0},
             {"addr": 787, "name": "Forward Overflow (High)", "val": 0},
-            {"addr": 812, "name": "Conductivity (Low Word)", "val": 0},
-            {"addr": 813, "name": "Conductivity (High Word)", "val": 0},
+            {"addr": 812, "name": "Conductivity (Word 0 - MSW)", "val": 0},
+            {"addr": 813, "name": "Conductivity (Word 1 - LSW)", "val": 0},
         ]
+        # addr -> name, so register writes don't round-trip through tree.item()
+        self._reg_name = {r["addr"]: r["name"] for r in self.register_map}
+        self._reg_addrs = set(self._reg_name)
+        # Live holding-register image (one uint16 slot per address); the source of truth for seeding the datastore
+        self._live = array.array('H', bytes(2000))
+        for r in self.register_map:
+            self._live[r["addr"]] = r["val"]
         
         # Table
         self.tree = ttk.Treeview(data_frame, columns=("Address", "Name", "Value"), show="headings", height=15)
@@ -253,16 +310,22 @@ class FlowMeterSimulatorApp:
         scrollbar.pack(side="right", fill="y")
         self.tree.configure(yscrollcommand=scrollbar.set)
 
-        # Initialize Data Rows
-        for reg in self.register_map:
-            self.tree.insert("", "end", iid=reg["addr"], values=(reg["addr"], reg["name"], reg["val"]))
+        # Initialize Data Rows (columns hidden while inserting so Tk lays out once; iids are str(addr))
+        rows = [(str(r["addr"]), (r["addr"], r["name"], r["val"])) for r in self.register_map]
+        self.tree.configure(displaycolumns=())
+        for iid, values in rows:
+            self.tree.insert("", "end", iid=iid, values=values)
+        self.tree.configure(displaycolumns=("Address", "Name", "Value"))
 
         # Edit Value
         edit_frame = ttk.Frame(data_frame)
         edit_frame.pack(fill="x", pady=5)
         ttk.Label(edit_frame, text="Selected Register Value (Int16):").pack(side="left", padx=5)
-        self.edit_val_var = tk.IntVar(value=0)
-        self.edit_entry = ttk.Entry(edit_frame, textvariable=self.edit_val_var)
+        self.edit_val_var = tk.StringVar(value="0")
+        # Keystroke validation keeps the field to '' or 0..65535, so update_register needs no range check
+        vcmd = (self.root.register(lambda s: s == '' or (s.isdigit() and int(s) <= 65535)), '%P')
+        self.edit_entry = ttk.Spinbox(edit_frame, from_=0, to=65535, increment=1, textvariable=self.edit_val_var,
+                                      validate="key", validatecommand=vcmd)
         self.edit_entry.pack(side="left", padx=5)
         # Bind Enter key
         self.edit_entry.bind('<Return>', lambda e: self.update_register())
@@ -286,16 +349,13 @@ class FlowMeterSimulatorApp:
 
     def float_to_registers(self, value):
         # Pack float as 4 bytes (Big Endian Float) -> Reg1: AB, Reg2: CD
-        b = struct.pack('>f', value) 
-        h = struct.unpack('>HH', b)
-        return h[0], h[1] # Low Addr, High Addr
+        return _HH.unpack(_F.pack(value)) # (MSW at low addr, LSW at high addr)
 
     def set_flow_rate(self):
         try:
             val = self.flow_rate_var.get()
             high, low = self.float_to_registers(val)
-            self.update_register_direct(778, high) 
-            self.update_register_direct(779, low)
+            self.update_registers_direct(778, [high, low])
             self.log(f"Set Flow Rate to {val} (Regs 778={high}, 779={low})")
         except Exception as e:
             messagebox.showerror("Error", f"Invalid Float: {e}")
@@ -304,8 +364,7 @@ class FlowMeterSimulatorApp:
         try:
             val = self.conductivity_var.get()
             high, low = self.float_to_registers(val)
-            self.update_register_direct(812, high)
-            self.update_register_direct(813, low)
+            self.update_registers_direct(812, [high, low])
             self.log(f"Set Conductivity to {val} (Regs 812={high}, 813={low})")
         except Exception as e:
             messagebox.showerror("Error", f"Invalid Float: {e}")
@@ -313,70 +372,94 @@ class FlowMeterSimulatorApp:
     def set_fwd_total(self):
         try:
             val = self.fwd_total_var.get()
-            # Uint32
-            b = struct.pack('>I', val)
-            high, low = struct.unpack('>HH', b)
-            self.update_register_direct(772, high)
-            self.update_register_direct(773, low)
+            # Uint32, MSW first like the floats
+            high, low = _HH.unpack(_I.pack(val))
+            self.update_registers_direct(772, [high, low])
             self.log(f"Set Total to {val} (Regs 772={high}, 773={low})")
         except Exception as e:
             messagebox.showerror("Error", f"Invalid Int: {e}")
 
 
+    def _on_gui(self, fn, *args):
+        # The only way code outside the Tk main thread may touch widgets, the store or GUI state
+        self.root.after(0, fn, *args)
+
     def update_register_direct(self, addr, val):
-        # Update Tree
-        if self.tree.exists(addr):
-             name = self.tree.item(addr)['values'][1]
-             self.tree.item(addr, values=(addr, name, val))
-        
-        # Update Store
-        if self.store:
-             self.store.setValues(3, addr, [val])
-             # Do not log every update to avoid spam, or log as INFO
-             # self.my_log(f"Updated {addr} -> {val}")
+        self.update_registers_direct(addr, [val])
 
-    def refresh_ports(self):
-        ports = serial.tools.list_ports.comports()
-        self.com_port_combo['values'] = [p.device for p in ports]
-        if ports:
-            self.com_port_combo.current(0)
-        ports = serial.tools.list_ports.comports()
-        self.com_port_combo['values'] = [p.device for p in ports]
+    def update_registers_direct(self, addr, vals):
+        """Write consecutive registers starting at addr with a single datastore call (any thread)"""
+        if threading.current_thread() is not threading.main_thread():
+            self._on_gui(self.update_registers_direct, addr, list(vals))
+            return
+
+        # No "unchanged" shortcut: a master may have rewritten these registers (FC6/FC16) since
+        # the GUI last set them, so re-applying the same value must still reach the store
+        if addr + len(vals) <= len(self._live):
+            self._live[addr:addr + len(vals)] = array.array('H', vals)
+
+        # Update Tree (coalesced)
+        for i, val in enumerate(vals):
+            if addr + i in self._reg_addrs:
+                self._queue_tree_row(addr + i, val)
+
+        # Update Store (same thread as the server loop, so never mid-request)
+        if self.store:
+            self.store.setValues(3, addr, list(vals))
+
+    def _queue_tree_row(self, addr, val):
+        # Main thread only; repeated writes to one row within a frame collapse to the last value
+        self._pending_tree[addr] = val
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.root.after(33, self._flush_tree)
+
+    def _flush_tree(self):
+        pending, self._pending_tree = self._pending_tree, {}
+        self._flush_scheduled = False
+        names = self._reg_name
+        item = self.tree.item
+        for addr, val in pending.items():
+            item(str(addr), values=(addr, names[addr], val))
+
+    def _list_ports(self, force=False):
+        # Reuse the last enumeration for 2s unless the user explicitly asked to refresh
+        now = time.monotonic()
+        if force or self._ports_cache is None or now - self._ports_cache[0] >= 2.0:
+            self._ports_cache = (now, [p.device for p in serial.tools.list_ports.comports()])
+        return self._ports_cache[1]
+
+    def refresh_ports(self, force=False):
+        ports = self._list_ports(force)
+        self.com_port_combo['values'] = ports
         if ports:
             self.com_port_combo.current(0)
 
     def on_tree_select(self, event):
         selected_item = self.tree.selection()
         if selected_item:
-            item = self.tree.item(selected_item)
-            val = item['values'][2] # Index 2 is Value now
-            self.edit_val_var.set(val)
+            # iid is the addr; read the live image (the tree row may still be waiting on a flush)
+            self.edit_val_var.set(self._live[int(selected_item[0])])
 
     def update_register(self):
         selected_item = self.tree.selection()
         if not selected_item:
             return
         
-        try:
-            val = int(self.edit_val_var.get())
-            if val < 0 or val > 65535:
-                messagebox.showerror("Error", "Value must be between 0 and 65535")
-                return
-            
-            iid = selected_item[0]
-            # iid is the addr
-            addr = int(iid)
-            name = self.tree.item(iid)['values'][1]
-            
-            # Update Tree
-            self.tree.item(iid, values=(addr, name, val))
-            
-            # Update Modbus Store if running
-            if self.store:
-                self.store.setValues(3, addr, [val])
-                self.log(f"Updated {name} ({addr}) to {val}")
-        except ValueError:
-            messagebox.showerror("Error", "Invalid integer")
+        text = self.edit_val_var.get()
+        if not text:
+            return
+        val = int(text)
+        
+        iid = selected_item[0]
+        # iid is the addr
+        addr = int(iid)
+        name = self._reg_name[addr]
+        
+        # Update Tree and Modbus Store (if running)
+        self.update_register_direct(addr, val)
+        if self.store:
+            self.log(f"Updated {name} ({addr}) to {val}")
 
     def log(self, msg):
         self.my_log(msg)
@@ -400,47 +483,36 @@ class FlowMeterSimulatorApp:
             # Initialize Data Store
             # We need to cover up to address 813. Let's allocate 1000 registers.
             
-            initial_regs = [0] * 1000
+            # Seeded from the live image (including edits made before Start); the block takes its own copy
             
-            for reg in self.register_map:
-                 addr = reg["addr"]
-                 val = reg["val"]
-                 # If user edited it, get from tree
-                 try:
-                    tree_item = self.tree.item(addr)
-                    if tree_item:
-                        val = int(tree_item['values'][2])
-                 except:
-                    pass
-                    
-                 if addr < 1000:
-                    initial_regs[addr] = val
-            
-            if ModbusSlaveContext is None or ModbusServerContext is None:
+            pm = _resolve_pymodbus()
+            if pm['ModbusSlaveContext'] is None or pm['ModbusServerContext'] is None:
                 raise ImportError("Modbus Context classes not found. Check Pymodbus installation.")
 
-            self.store = ModbusSlaveContext(
-                di=ModbusSequentialDataBlock(0, [0]*1000),
-                co=ModbusSequentialDataBlock(0, [0]*1000),
-                hr=ModbusSequentialDataBlock(0, initial_regs),
-                ir=ModbusSequentialDataBlock(0, [0]*1000)
+            self.store = pm['ModbusSlaveContext'](
+                di=BitArrayBlock(0, bytes(2000)),
+                co=BitArrayBlock(0, bytes(2000)),
+                hr=RegisterArrayBlock(0, self._live),
+                ir=RegisterArrayBlock(0, bytes(2000))
             )
             
-            self.context = ModbusServerContext(slaves={slave_id: self.store}, single=False)
+            try:
+                self.context = pm['ModbusServerContext'](devices={slave_id: self.store}, single=False)
+            except TypeError:
+                # pymodbus < 3.10 spells it slaves=
+                self.context = pm['ModbusServerContext'](slaves={slave_id: self.store}, single=False)
             
-            if StartSerialServer is None and StartAsyncSerialServer is None and ModbusSerialServer is None:
-                 raise ImportError("No Server implementation found (StartSerialServer, StartAsyncSerialServer, ModbusSerialServer are all None)")
+            if pm['StartAsyncSerialServer'] is None:
+                 raise ImportError("No async Server implementation found (StartAsyncSerialServer is None)")
 
-            self.server_thread = threading.Thread(target=self.run_server_thread, args=(port, baud, self.context))
-            self.server_thread.daemon = True
-            self.server_thread.start()
+            self._server_task = self._loop.create_task(self._serve(port, baud, self.context))
             
             self.start_btn.config(state="disabled")
             self.stop_btn.config(state="normal")
             self.log("Server Started (Background).")
             
         except Exception as e:
-            self.log(f"CRASH STARTING SERVER: {e}")
+            self.my_logger.error(f"CRASH STARTING SERVER: {e}")
             messagebox.showerror("Error Starting Server", str(e))
             # Print debug info
             import sys
@@ -450,43 +522,38 @@ class FlowMeterSimulatorApp:
                     self.log(f"Pymodbus file: {sys.modules['pymodbus'].__file__}")
                  except: pass
 
-    def run_server_thread(self, port, baud, context):
-        identity = None
-        if ModbusDeviceIdentification:
-            identity = ModbusDeviceIdentification()
-            identity.VendorName = 'Simulated Flow Meter'
-            identity.ProductCode = 'SFM'
-            identity.VendorUrl = 'http://github.com/pymodbus'
-            identity.ProductName = 'Flow Meter Server'
-            identity.ModelName = 'Modbus Server'
-            identity.MajorMinorRevision = '1.0'
-
+    async def _serve(self, port, baud, context):
+        """Run the async serial server on self._loop until it exits or is stopped"""
+        pm = _resolve_pymodbus()
         try:
-            if StartSerialServer:
-                 # Sync wrapper
-                 self.log(f"Using Sync StartSerialServer on {port}...")
-                 StartSerialServer(context=context, identity=identity, port=port, framer=ModbusRtuFramer, stopbits=1, bytesize=8, parity='N', baudrate=baud)
-            elif StartAsyncSerialServer:
-                 # Async wrapper
-                 self.log(f"Using Async StartAsyncSerialServer on {port}...")
-                 asyncio.run(StartAsyncSerialServer(context=context, identity=identity, port=port, framer=ModbusRtuFramer, stopbits=1, bytesize=8, parity='N', baudrate=baud))
-            elif ModbusSerialServer:
-                 # Direct class usage (common in 3.x if helpers missing)
-                 self.log(f"Using ModbusSerialServer Class on {port}...")
-                 # Note: ModbusSerialServer might take slightly different args in 3.11?
-                 # It usually takes (context, framer, ...) and then we call serve_forever
-                 # But in 3.x it might be context=...
-                 # Let's try standard 3.x init
-                 server = ModbusSerialServer(context=context, framer=ModbusRtuFramer, port=port, stopbits=1, bytesize=8, parity='N', baudrate=baud)
-                 server.serve_forever()
-            else:
-                self.log("No Server implementation found to run.")
+            self.log(f"Using Async StartAsyncSerialServer on {port}...")
+            await pm['StartAsyncSerialServer'](context=context, identity=self._identity, port=port, framer=pm['RtuFramer'], stopbits=1, bytesize=8, parity='N', baudrate=baud)
+        except asyncio.CancelledError:
+            self.log("Server task cancelled.")
         except Exception as e:
-            print(f"Server Error: {e}")
-            self.log(f"Server Error: {e}")
+            log.exception("Serial server crashed: %s", e)
+        finally:
+            if self._server_task is asyncio.current_task():
+                self._server_task = None
+
+    async def _shutdown(self):
+        # Prefer pymodbus' own stop (closes the serial transport); fall back to cancelling
+        task = self._server_task
+        if task is None:
+            return
+        stop = _PM.get('ServerAsyncStop')
+        if stop:
+            try:
+                await stop()
+                return
+            except Exception as e:
+                self.log(f"ServerAsyncStop failed, cancelling: {e}")
+        task.cancel()
 
     def stop_server(self):
-        self.log("Stopping server... (Restart App to fully reset port)")
+        self.log("Stopping server...")
+        # Runs on the next pump tick
+        self._loop.create_task(self._shutdown())
         self.start_btn.config(state="normal")
         self.stop_btn.config(state="disabled")
         
@@ -1,149 +1,152 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import threading
 import logging
 import asyncio
 import serial.tools.list_ports
 import struct
+import array
+import os
 import sys
 import time
+import collections
+import re
+
+from register_blocks import RegisterArrayBlock, BitArrayBlock
 
 # --- Pymodbus v3.x Robust Imports ---
-print(f"Debug: Pymodbus import check...")
+# Set MODBUS_SIM_IMPORT_DEBUG=1 to print what was found; silent otherwise
+_IMPORT_DEBUG = os.environ.get('MODBUS_SIM_IMPORT_DEBUG') == '1'
 
-# Check Serial Dependency
-try:
-    import serial
-    print(f"Debug: serial imported from {serial.__file__}")
-except ImportError as e:
-    print(f"Debug: FAILED to import serial: {e}")
 
-StartSerialServer = None
-StartAsyncSerialServer = None
-ModbusSerialServer = None
-ServerStop = None  # PATCH: Added for v3.11.4
+def _import_debug(msg):
+    if _IMPORT_DEBUG:
+        print(f"Debug: {msg}")
 
-try:
-    import pymodbus.server
-    print(f"Debug: pymodbus.server dir: {dir(pymodbus.server)}")
-except ImportError as e:
-    print(f"Debug: Failed to import pymodbus.server module: {e}")
 
+# Check Serial Dependency
 try:
-    from pymodbus.server import StartSerialServer
-    print("Debug: Imported StartSerialServer")
+    import serial
+    _import_debug(f"serial imported from {serial.__file__}")
 except ImportError as e:
-    print(f"Debug: Failed to import StartSerialServer: {e}")
+    print(f"Debug: FAILED to import serial: {e}")
 
+# The only server start_server uses (it runs on the Tk-pumped asyncio loop)
 try:
     from pymodbus.server import StartAsyncSerialServer
-    print("Debug: Imported StartAsyncSerialServer")
+    _import_debug("Imported StartAsyncSerialServer")
+    if _IMPORT_DEBUG:
+        import pymodbus.server
+        _import_debug(f"pymodbus.server dir: {dir(pymodbus.server)}")
 except ImportError as e:
     print(f"Debug: Failed to import StartAsyncSerialServer: {e}")
+    StartAsyncSerialServer = None
 
+# Stops the async server from inside its own loop
 try:
-    from pymodbus.server import ModbusSerialServer
-    print("Debug: Imported ModbusSerialServer")
+    from pymodbus.server import ServerAsyncStop
 except ImportError as e:
-    print(f"Debug: Failed to import ModbusSerialServer: {e}")
+    _import_debug(f"Failed to import ServerAsyncStop: {e}")
+    ServerAsyncStop = None
 
-# PATCH: Import ServerStop for v3.11.4 compatibility
 try:
-    from pymodbus.server import ServerStop
-    print("Debug: Imported ServerStop")
+    from pymodbus.framer import FramerType
 except ImportError as e:
-    print(f"Debug: Failed to import ServerStop: {e}")
+    print(f"Debug: Failed to import FramerType: {e}")
+    FramerType = None
 
 try:
     from pymodbus.device import ModbusDeviceIdentification
 except ImportError:
     ModbusDeviceIdentification = None
 
-# Datastore Imports - Try multiple strategies for v3.x
-ModbusServerContext = None
-ModbusSlaveContext = None
-ModbusSequentialDataBlock = None
-
-# Strategy 1: Try v3.6+ imports
+# Datastore: only the server context comes from pymodbus (the blocks are in register_blocks.py)
 try:
     from pymodbus.datastore import ModbusServerContext
-    from pymodbus.datastore import ModbusSequentialDataBlock
-    print("Debug: Imported ModbusServerContext and ModbusSequentialDataBlock")
-    
-    # Try to import ModbusSlaveContext (doesn't exist in v3.6+)
-    try:
-        from pymodbus.datastore import ModbusSlaveContext
-        print("Debug: Imported ModbusSlaveContext")
-    except ImportError:
-        # In v3.6+, we build slave context manually as dict
-        print("Debug: ModbusSlaveContext not available (v3.6+ - will use dict approach)")
-        
+    _import_debug(f"ModbusServerContext = {ModbusServerContext}")
 except ImportError as e:
-    print(f"Debug: Strategy 1 failed: {e}")
-
-# Strategy 2: Individual imports with fallbacks for older v3.x
-if ModbusServerContext is None:
-    try:
-        from pymodbus.datastore.context import ModbusServerContext
-        print("Debug: Imported ModbusServerContext from .context")
-    except ImportError as e:
-        print(f"Debug: Failed to import ModbusServerContext: {e}")
-
-if ModbusSequentialDataBlock is None:
-    try:
-        from pymodbus.datastore.store import ModbusSequentialDataBlock
-        print("Debug: Imported ModbusSequentialDataBlock from .store")
-    except ImportError:
-        try:
-            from pymodbus.datastore.sequential import ModbusSequentialDataBlock
-            print("Debug: Imported ModbusSequentialDataBlock from .sequential")
-        except ImportError as e:
-            print(f"Debug: Failed to import ModbusSequentialDataBlock: {e}")
-
-# Final check and report
-print(f"Debug: ModbusServerContext = {ModbusServerContext}")
-print(f"Debug: ModbusSlaveContext = {ModbusSlaveContext}")
-print(f"Debug: ModbusSequentialDataBlock = {ModbusSequentialDataBlock}")
+    print(f"Debug: Failed to import ModbusServerContext: {e}")
+    ModbusServerContext = None
 
 # Configure logging
 logging.basicConfig()
 log = logging.getLogger()
 log.setLevel(logging.INFO)
 
+# Precompiled big-endian packers: value -> 4 bytes -> (MSW, LSW)
+_F = struct.Struct('>f')
+_I = struct.Struct('>I')
+_HH = struct.Struct('>HH')
+
 
 class TextHandler(logging.Handler):
-    def __init__(self, text_widget):
+    """Formats and tags records as they are logged; the Tk loop inserts them in batches (see drain)"""
+    # Identical records within this many seconds of the last shown one are counted, not shown ...
+    REPEAT_WINDOW = 1.0
+    # ... up to this many, after which the count is reported and the next one is shown again
+    REPEAT_MAX = 100
+    # Color tag classifier, one scan per message: RX/TX words in any case, ERR words as spelled.
+    # The earliest match in the message decides the tag.
+    _TAG_RE = re.compile(r'(?P<RX>(?i:received|recv))|(?P<TX>(?i:send))|(?P<ERR>Error|Exception)')
+
+    def __init__(self, text_widget, maxlen=2000):
         super().__init__()
         self.text_widget = text_widget
+        # Bounded: under heavy traffic the oldest lines are dropped instead of growing without limit
+        self.pending = collections.deque(maxlen=maxlen)
+        # Last shown record (level, raw msg, args), when it was shown, its tag, and how many copies were swallowed
+        self._last_key = None
+        self._last_ts = 0.0
+        self._last_tag = "INFO"
+        self._repeats = 0
         self.text_widget.tag_config("RX", foreground="blue")
         self.text_widget.tag_config("TX", foreground="green")
         self.text_widget.tag_config("ERR", foreground="red")
         self.text_widget.tag_config("INFO", foreground="black")
 
     def emit(self, record):
-        msg = self.format(record)
+        # Collapse bursts of the same record (CRC errors, malformed frames, ...) into one count line.
+        # emit() runs under the handler lock, so the counters need no locking of their own.
+        key = (record.levelno, record.msg, record.args)
+        now = time.monotonic()
+        if key == self._last_key and now - self._last_ts < self.REPEAT_WINDOW and self._repeats < self.REPEAT_MAX:
+            self._repeats += 1
+            return
+        if self._repeats:
+            self.pending.append((f"... previous message repeated {self._repeats}x", self._last_tag))
+            self._repeats = 0
+        self._last_key, self._last_ts = key, now
         
-        # FILTER: Prevent performance degradation from Device 100 spam
-        if "requested device id does not exist: 100" in msg:
-            return  # Silently drop to prevent GUI/performance issues
+        msg = self.format(record)
         
         # Simple color coding based on content
-        tag = "INFO"
-        if "Received" in msg or "recv" in msg.lower():
-            tag = "RX"
-        elif "Sending" in msg or "send" in msg.lower():
-            tag = "TX"
-        elif "Error" in msg or "Exception" in msg:
-            tag = "ERR"
-            
-        def append():
-            self.text_widget.configure(state='normal')
-            self.text_widget.insert('end', msg + '\n', tag)
-            self.text_widget.see('end')
-            self.text_widget.configure(state='disabled')
-            
-        # Ensure thread safety for GUI updates
-        self.text_widget.after(0, append)
+        m = self._TAG_RE.search(msg)
+        tag = m.lastgroup if m else "INFO"
+        self._last_tag = tag
+        
+        # Queued rather than inserted: pymodbus logs per frame, and only drain() (every 50 ms) touches the widget
+        self.pending.append((msg, tag))
+
+    def drain(self, limit=200):
+        """Main thread only: insert up to limit pending records with one insert call"""
+        pending = self.pending
+        if not pending:
+            return
+        # Merge consecutive same-tag records into one (text, tag) segment
+        segments = []
+        buf, cur = [], None
+        for _ in range(min(limit, len(pending))):
+            msg, tag = pending.popleft()
+            if tag != cur and buf:
+                segments += ('\n'.join(buf) + '\n', cur)
+                buf = []
+            cur = tag
+            buf.append(msg)
+        segments += ('\n'.join(buf) + '\n', cur)
+
+        self.text_widget.configure(state='normal')
+        self.text_widget.insert('end', *segments)
+        self.text_widget.see('end')
+        self.text_widget.configure(state='disabled')
 
 
 # --- Custom ModbusSlaveContext to fix v3.x compatibility ---
@@ -159,6 +162,14 @@ class ModbusSlaveContext:
         if hr: self.store['h'] = hr
         if ir: self.store['i'] = ir
         self.zero_mode = zero_mode
+        # Function code -> block, resolved once so each request is a single dict lookup
+        self._fx2block = {}
+        for key, codes in (('c', (1, 5, 15)), ('d', (2,)), ('h', (3, 6, 16)), ('i', (4,))):
+            block = self.store.get(key)
+            if block:
+                self._fx2block.update(dict.fromkeys(codes, block))
+        # Function code -> (first, end) address bounds; blocks never change size, so validate needs no call
+        self._fx_bounds = {fx: (blk.address, blk.address + len(blk.values)) for fx, blk in self._fx2block.items()}
 
     def __str__(self):
         return "ModbusSlaveContext"
@@ -168,41 +179,29 @@ class ModbusSlaveContext:
             block.reset()
 
     def validate(self, fx, address, count=1):
-        if fx in [1, 5, 15]: block = self.store.get('c')
-        elif fx in [2]:      block = self.store.get('d')
-        elif fx in [3, 6, 16]: block = self.store.get('h')
-        elif fx in [4]:      block = self.store.get('i')
-        else: return False
-        
-        if not block: return False
-        return block.validate(address, count)
+        bounds = self._fx_bounds.get(fx)
+        return bounds is not None and bounds[0] <= address and address + count <= bounds[1]
 
     def getValues(self, fx, address, count=1):
-        # logging.debug(f"getValues fx={fx}, addr={address}, count={count}")
-        if fx in [1, 5, 15]: block = self.store.get('c')
-        elif fx in [2]:      block = self.store.get('d')
-        elif fx in [3, 6, 16]: block = self.store.get('h')
-        elif fx in [4]:      block = self.store.get('i')
-        else: return []
-        
-        vals = block.getValues(address, count)
-        # logging.debug(f" -> Returning: {vals}")
-        return vals
+        block = self._fx2block.get(fx)
+        return block.getValues(address, count) if block is not None else []
 
     def setValues(self, fx, address, values):
-        if fx in [1, 5, 15]: block = self.store.get('c')
-        elif fx in [2]:      block = self.store.get('d')
-        elif fx in [3, 6, 16]: block = self.store.get('h')
-        elif fx in [4]:      block = self.store.get('i')
-        else: return
-        
-        block.setValues(address, values)
-        
+        block = self._fx2block.get(fx)
+        if block is not None:
+            return block.setValues(address, values)
+
+    # pymodbus awaits these two directly from the request PDUs, so they must stay coroutines.
+    # Neither awaits anything (no hop through getValues/setValues): each completes in one step.
     async def async_getValues(self, fx, address, count=1):
-        return self.getValues(fx, address, count)
-        
+        block = self._fx2block.get(fx)
+        return block.getValues(address, count) if block is not None else []
+
     async def async_setValues(self, fx, address, values):
-        return self.setValues(fx, address, values)
+        block = self._fx2block.get(fx)
+        if block is not None:
+            # An ExcCodes result (e.g. ILLEGAL_ADDRESS) becomes the exception response
+            return block.setValues(address, values)
 
 
 class FlowMeterSimulatorApp:
@@ -211,11 +210,26 @@ class FlowMeterSimulatorApp:
         self.root.title("Flow Meter Simulator (Modbus RTU Slave) - FIXED v3.11.4")
         self.root.geometry("900x850")
 
-        self.server_thread = None
-        self.stop_server_event = threading.Event()
         self.context = None
         self.store = None
 
+        # One asyncio loop for the app's lifetime, pumped from the Tk mainloop (no server thread):
+        # the server, the datastore and the widgets are all touched from the main thread only
+        self._loop = asyncio.new_event_loop()
+        self._server_task = None
+        self.root.after(50, self._pump_loop)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # addr -> latest value, applied to the Treeview's Value column in one pass per 100ms
+        self._tree_dirty = {}
+        self._tree_flush_scheduled = False
+        # Values for rows scrolled out of view, written when they scroll back in; visible (first, last) fractions
+        self._tree_offscreen = {}
+        self._tree_view = (0.0, 1.0)
+
+        # Current value of register 777 (Alarm Flags); kept by update_register_direct so toggles never parse the tree
+        self._alarm_flags = 0
+
         self.setup_ui()
         
         # Setup Logging to GUI
@@ -231,13 +245,36 @@ class FlowMeterSimulatorApp:
         self.my_logger.setLevel(logging.INFO)
         self.my_logger.addHandler(self.log_handler)
         
+        self._flush_logs()
+        
         # Check imports availability
-        if not StartAsyncSerialServer and not StartSerialServer:
-            self.my_log("ERROR: Could not import Pymodbus Server function. Check version.")
+        if StartAsyncSerialServer is None or FramerType is None:
+            self.my_log("ERROR: Could not import StartAsyncSerialServer/FramerType. Check Pymodbus version.")
 
     def my_log(self, msg):
         self.my_logger.info(msg)
 
+    def _flush_logs(self):
+        self.log_handler.drain()
+        self.root.after(50, self._flush_logs)
+
+    def _pump_loop(self):
+        # Run every ready asyncio callback once, then hand control back to Tk.
+        # Poll often while the server is up (it owns the serial port), rarely when idle.
+        self._loop.call_soon(self._loop.stop)
+        self._loop.run_forever()
+        self.root.after(5 if self._server_task is not None else 50, self._pump_loop)
+
+    def on_close(self):
+        # Stop the server (releasing the port) before Tk goes away
+        if self._server_task is not None:
+            try:
+                self._loop.run_until_complete(asyncio.wait_for(self._shutdown(), 2))
+            except Exception:
+                pass
+        self._loop.close()
+        self.root.destroy()
+
     def setup_ui(self):
         # Configuration Frame
         config_frame = ttk.LabelFrame(self.root, text="Configuration", padding="10")
@@ -336,6 +373,8 @@ class FlowMeterSimulatorApp:
             {"addr": 284, "name": "Alm Low Val (Word 0 - MSW)", "val": 0x4120, "type": "HR"},   # 10.0
             {"addr": 285, "name": "Alm Low Val (Word 1 - LSW)", "val": 0x0000, "type": "HR"},
         ]
+        # addr -> table row (iid = address, rows in register_map order): rows that exist, answered without asking Tk
+        self._row_index = {r['addr']: i for i, r in enumerate(self.register_map)}
         
         # Table
         self.tree = ttk.Treeview(data_frame, columns=("Address", "Type", "Name", "Value"), show="headings", height=15)
@@ -352,7 +391,8 @@ class FlowMeterSimulatorApp:
         # Scrollbar
         scrollbar = ttk.Scrollbar(data_frame, orient="vertical", command=self.tree.yview)
         scrollbar.pack(side="right", fill="y")
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree_scrollbar = scrollbar
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
 
         # Initialize Data Rows
         for reg in self.register_map:
@@ -387,15 +427,11 @@ class FlowMeterSimulatorApp:
 
     def float_to_registers(self, value):
         """Pack float as Big Endian, return (MSW, LSW)"""
-        b = struct.pack('>f', value)
-        regs = struct.unpack('>HH', b)
-        return regs[0], regs[1]  # MSW, LSW
+        return _HH.unpack(_F.pack(value))
 
     def uint32_to_registers(self, value):
         """Pack Uint32 as Big Endian, return (MSW, LSW)"""
-        b = struct.pack('>I', value)
-        regs = struct.unpack('>HH', b)
-        return regs[0], regs[1]  # MSW, LSW
+        return _HH.unpack(_I.pack(value))
 
     def set_flow_rate(self):
         try:
@@ -431,8 +467,8 @@ class FlowMeterSimulatorApp:
     def set_alarm_flags(self):
         try:
             val_str = self.alarm_flags_var.get()
-            val = int(val_str, 16) if val_str.startswith('0x') else int(val_str)
-            if val < 0 or val > 0xFFFF:
+            val = int(val_str, 0)  # 0x.., 0o.., 0b.. or decimal
+            if val & ~0xFFFF:
                 raise ValueError("Out of range")
             self.update_register_direct(777, val)
             self.log(f"✓ Set Alarm Flags to 0x{val:04X}")
@@ -442,15 +478,9 @@ class FlowMeterSimulatorApp:
     def toggle_alarm_bit(self, bit, state):
         """Toggle specific alarm bit"""
         try:
-            if self.tree.exists(777):
-                current_val = int(self.tree.item(777)['values'][3], 16)
-            else:
-                current_val = 0
-            
-            if state:
-                new_val = current_val | (1 << bit)
-            else:
-                new_val = current_val & ~(1 << bit)
+            # Clear the bit, then OR it back in when state is set (-1 is all ones, 0 masks it out)
+            mask = 1 << bit
+            new_val = (self._alarm_flags & ~mask) | (-bool(state) & mask)
             
             self.update_register_direct(777, new_val)
             self.alarm_flags_var.set(f"0x{new_val:04X}")
@@ -462,17 +492,50 @@ class FlowMeterSimulatorApp:
 
     def update_register_direct(self, addr, val):
         """Update both GUI and Modbus stores (HR + IR)"""
-        # Update Tree
-        if self.tree.exists(addr):
-            item = self.tree.item(addr)
-            reg_type = item['values'][1]
-            name = item['values'][2]
-            self.tree.item(addr, values=(addr, reg_type, name, f"0x{val:04X}"))
+        if addr == 777:
+            self._alarm_flags = val
         
-        # Update BOTH Modbus Stores (This is the FIX!)
+        # Update Tree (coalesced; repeated writes to one row within a flush collapse to the last value)
+        self._tree_dirty[addr] = val
+        if not self._tree_flush_scheduled:
+            self._tree_flush_scheduled = True
+            self.root.after(100, self._flush_tree)
+        
+        # Update BOTH Modbus Stores (This is the FIX!) - HR (FC 03) and IR (FC 04) in one write
         if self.store:
-            self.store.setValues(3, addr, [val])  # Holding Registers (FC 03)
-            self.store.setValues(4, addr, [val])  # Input Registers (FC 04) ← CRITICAL FIX
+            self.store.set_both(addr, val)
+
+    def _flush_tree(self, everything=False):
+        dirty, self._tree_dirty = self._tree_dirty, {}
+        self._tree_flush_scheduled = False
+        if everything and self._tree_offscreen:
+            self._tree_offscreen.update(dirty)
+            dirty, self._tree_offscreen = self._tree_offscreen, {}
+        tree, index, offscreen = self.tree, self._row_index, self._tree_offscreen
+        # Visible row range from the last yview, one row of slack each side; rows outside it are parked
+        n = len(index)
+        first, last = self._tree_view
+        lo, hi = first * n - 1, last * n + 1
+        for addr, val in dirty.items():
+            row = index.get(addr)
+            if row is None:
+                continue
+            if everything or lo <= row <= hi:
+                # Only the Value cell changes; address/type/name were set once on insert
+                tree.set(addr, "Value", f"0x{val:04X}")
+            else:
+                offscreen[addr] = val
+
+    def _on_tree_scroll(self, first, last):
+        self.tree_scrollbar.set(first, last)
+        self._tree_view = (float(first), float(last))
+        # Parked rows may have just come into view
+        if self._tree_offscreen:
+            self._tree_dirty = {**self._tree_offscreen, **self._tree_dirty}
+            self._tree_offscreen = {}
+            if not self._tree_flush_scheduled:
+                self._tree_flush_scheduled = True
+                self.root.after(100, self._flush_tree)
 
     def refresh_ports(self):
         ports = serial.tools.list_ports.comports()
@@ -481,6 +544,7 @@ class FlowMeterSimulatorApp:
             self.com_port_combo.current(0)
 
     def on_tree_select(self, event):
+        self._flush_tree(everything=True)
         selected_item = self.tree.selection()
         if selected_item:
             item = self.tree.item(selected_item)
@@ -495,9 +559,9 @@ class FlowMeterSimulatorApp:
         
         try:
             val_str = self.edit_val_var.get()
-            val = int(val_str, 16) if val_str.startswith('0x') else int(val_str)
+            val = int(val_str, 0)  # 0x.., 0o.., 0b.. or decimal
             
-            if val < 0 or val > 65535:
+            if val & ~0xFFFF:
                 messagebox.showerror("Error", "Value must be between 0 and 65535")
                 return
             
@@ -530,8 +594,8 @@ class FlowMeterSimulatorApp:
 
             self.log(f"Starting Server on {port} (Slave ID: {slave_id})...")
             
-            # Initialize Data Store with 1000 registers
-            initial_regs = [0] * 1000
+            # Initialize Data Store with 1000 registers (uint16 slots, zero-filled)
+            initial_regs = array.array('H', bytes(2000))
             
             # Populate with default values
             for reg in self.register_map:
@@ -540,14 +604,16 @@ class FlowMeterSimulatorApp:
                 if addr < 1000:
                     initial_regs[addr] = val
             
-            if ModbusSequentialDataBlock is None or ModbusServerContext is None:
+            if ModbusServerContext is None:
                 raise ImportError("Modbus classes not found. Check Pymodbus installation.")
 
-            # CRITICAL FIX: Create datastore blocks
-            di_block = ModbusSequentialDataBlock(0, [0]*1000)
-            co_block = ModbusSequentialDataBlock(0, [0]*1000)
-            hr_block = ModbusSequentialDataBlock(0, initial_regs.copy())
-            ir_block = ModbusSequentialDataBlock(0, initial_regs.copy())
+            # CRITICAL FIX: Create datastore blocks (array-backed; each block takes its own copy)
+            di_block = BitArrayBlock(0, bytes(2000))
+            co_block = BitArrayBlock(0, bytes(2000))
+            hr_block = RegisterArrayBlock(0, initial_regs)
+            # HR and IR always hold the same image: the IR block reads the HR block's array instead of a copy
+            ir_block = RegisterArrayBlock(0, ())
+            ir_block.values = hr_block.values
             
             self.log("✓ Using v3.6+ API...")
             
@@ -562,15 +628,10 @@ class FlowMeterSimulatorApp:
             # In v3.6+, the first parameter is the datastore, not a slaves dict
             # To support multiple slaves, we need a different approach
             
-            # Create slave context dict mapping slave ID to our shim
-            # AUTOMATICALLY ADD SLAVE 111 & 100 for multi-device support
-            slaves = {slave_id: slave_context}
-            if slave_id != 111:
-                slaves[111] = slave_context
-                self.log("✓ Auto-added Slave ID 111 for dual-device simulation")
-            if slave_id != 100:
-                slaves[100] = slave_context
-                self.log("✓ Auto-added Slave ID 100 to eliminate error overhead")
+            # Only these IDs are answered (other slaves share the RS-485 bus); requests for any
+            # other ID are ignored quietly by the server (ignore_missing_devices, see _serve)
+            slaves = dict.fromkeys((slave_id, 111, 100), slave_context)
+            self.log(f"✓ Answering Slave IDs {list(slaves.keys())}")
 
             try:
                 # Proper initialization with 'devices' arg (PyModbus v3.x)
@@ -595,53 +656,34 @@ class FlowMeterSimulatorApp:
                 def __init__(self, hr_block, ir_block):
                     self.hr_block = hr_block
                     self.ir_block = ir_block
-                
-                def setValues(self, fx, address, values):
-                    """Update register values - updates both HR and IR"""
-                    if fx == 3:  # Holding Registers
-                        for i, val in enumerate(values):
-                            self.hr_block.setValues(address + i, [val])
-                    elif fx == 4:  # Input Registers
-                        for i, val in enumerate(values):
-                            self.ir_block.setValues(address + i, [val])
+
+                def set_both(self, address, value):
+                    """Write one register to HR and IR (a single store into the shared array)"""
+                    self.hr_block.values[address - self.hr_block.address] = value
             
             self.store = DatastoreWrapper(hr_block, ir_block)
             
-            if StartSerialServer is None and StartAsyncSerialServer is None and ModbusSerialServer is None:
-                raise ImportError("No Server implementation found")
+            if StartAsyncSerialServer is None or FramerType is None:
+                raise ImportError("No async Server implementation found (StartAsyncSerialServer/FramerType missing)")
+
+            # Test if port is accessible (the async server would only report this from inside the loop)
+            try:
+                test_port = serial.Serial(port, baud, timeout=0.1)
+                test_port.close()
+            except Exception as e:
+                raise IOError(f"Cannot open {port}: {e}")
+            self.log(f"✓ Port {port} opened successfully")
 
             self.start_btn.config(state="disabled")
             self.stop_btn.config(state="normal")
-            self.log("✓ Starting server thread...")
-            
-            # Force GUI update before starting thread
-            self.root.update()
-
-            self.server_thread = threading.Thread(
-                target=self.run_server_thread, 
-                args=(port, baud, self.context),
-                daemon=True,
-                name="ModbusServerThread"
-            )
-            
-            self.log("✓ Thread object created, calling start()...")
-            self.root.update()
-            
-            self.server_thread.start()
-            
-            self.log("✓ start() called, checking if alive...")
-            self.root.update()
-            
-            # Verify thread started
-            import time
-            time.sleep(0.5)
-            
-            if self.server_thread.is_alive():
-                self.log("✓ Server Thread is ALIVE and running")
-            else:
-                self.log("✗ WARNING: Server thread died immediately!")
+            self.log("✓ Starting server task...")
+
+            # Runs on self._loop from the next pump tick on
+            self._server_task = self._loop.create_task(self._serve(port, baud, self.context))
             
-            self.log("✓ Server startup complete - GUI should be responsive")
+            self.log("✓ Server task created on the GUI event loop")
+            # Checked once the pump has had a few ticks to open the port
+            self.root.after(100, self._verify_server_alive)
             
         except Exception as e:
             self.start_btn.config(state="normal")
@@ -651,72 +693,72 @@ class FlowMeterSimulatorApp:
             self.log(traceback.format_exc())
             messagebox.showerror("Error Starting Server", str(e))
 
-    def run_server_thread(self, port, baud, context):
-        """Run Modbus server in background thread - PATCHED for v3.11.4"""
+    def _verify_server_alive(self):
+        # _serve clears _server_task (and resets the buttons) when the server exits
+        if self._server_task is not None and not self._server_task.done():
+            self.log("✓ Server startup complete - GUI should be responsive")
+        else:
+            self.log("✗ Server stopped during startup - see the log above")
+
+    async def _serve(self, port, baud, context):
+        """Run the async serial server on self._loop until it exits or is stopped"""
         try:
-            # Thread-safe logging
-            def thread_log(msg):
-                self.root.after(0, lambda: self.my_log(msg))
+            self.my_log(f"═══════════════════════════════════════")
+            self.my_log(f"SERVER STARTING (v3.11.4 Patch)")
+            self.my_log(f"Port: {port}")
+            self.my_log(f"Baudrate: {baud}")
+            self.my_log(f"═══════════════════════════════════════")
+            
+            # CRITICAL FIX: Use FramerType.RTU
+            await StartAsyncSerialServer(
+                context=context,
+                port=port,
+                framer=FramerType.RTU,
+                baudrate=baud,
+                bytesize=8,
+                parity='N',
+                stopbits=1,
+                timeout=0.100,
+                # Frames for other slaves on the bus: no reply and no "device id does not exist" log
+                ignore_missing_devices=True
+            )
             
-            thread_log(f"═══════════════════════════════════════")
-            thread_log(f"SERVER THREAD STARTING (v3.11.4 Patch)")
-            thread_log(f"Port: {port}")
-            thread_log(f"Baudrate: {baud}")
-            thread_log(f"═══════════════════════════════════════")
+            self.my_log("✓ StartAsyncSerialServer exited")
             
-            # Test if port is accessible
+        except asyncio.CancelledError:
+            self.my_log("Server task cancelled.")
+        except Exception as e:
+            self.my_log(f"═══════════════════════════════════════")
+            self.my_log(f"✗✗✗ FATAL SERVER ERROR ✗✗✗")
+            self.my_log(f"{e}")
+            import traceback
+            self.my_log(traceback.format_exc())
+            self.my_log(f"═══════════════════════════════════════")
+        finally:
+            if self._server_task is asyncio.current_task():
+                self._server_task = None
+                self.start_btn.config(state="normal")
+                self.stop_btn.config(state="disabled")
+
+    async def _shutdown(self):
+        # Prefer pymodbus' own stop (closes the serial transport); fall back to cancelling
+        task = self._server_task
+        if task is None:
+            return
+        if ServerAsyncStop is not None:
             try:
-                import serial
-                test_port = serial.Serial(port, baud, timeout=0.1)
-                thread_log(f"✓ Port {port} opened successfully")
-                test_port.close()
-            except Exception as e:
-                thread_log(f"✗ WARNING: Cannot open {port}: {e}")
+                await ServerAsyncStop()
                 return
-            
-            # pymodbus server initialization
-            try:
-                from pymodbus.server import StartSerialServer
-                from pymodbus.framer import FramerType
-                
-                thread_log("✓ Using StartSerialServer (v3.11.4)...")
-                
-                # CRITICAL FIX: Use FramerType.RTU
-                StartSerialServer(
-                    context=context,
-                    port=port,
-                    framer=FramerType.RTU,
-                    baudrate=baud,
-                    bytesize=8,
-                    parity='N',
-                    stopbits=1,
-                    timeout=0.100
-                )
-                
-                thread_log("✓ StartSerialServer exited")
-                
-            except Exception as e1:
-                thread_log(f"✗ StartSerialServer failed: {e1}")
-                import traceback
-                thread_log(traceback.format_exc())
-                
-        except Exception as e:
-            def log_error():
-                self.my_log(f"═══════════════════════════════════════")
-                self.my_log(f"✗✗✗ FATAL SERVER THREAD ERROR ✗✗✗")
-                self.my_log(f"{e}")
-                import traceback
-                self.my_log(traceback.format_exc())
-                self.my_log(f"═══════════════════════════════════════")
-            self.root.after(0, log_error)
+            except Exception as e:
+                self.log(f"ServerAsyncStop failed, cancelling: {e}")
+        task.cancel()
 
     def stop_server(self):
         try:
-            self.log("⚠ Stopping server... (Restart App to fully reset port)")
+            self.log("⚠ Stopping server...")
             
-            # NOTE: ServerStop() doesn't work with synchronous StartSerialServer
-            # The server thread will continue until the app exits
-            self.log("⚠ Server thread will stop when app closes (synchronous server limitation)")
+            # Runs on the next pump tick (closes the serial port, then _serve returns)
+            self._loop.create_task(self._shutdown())
                 
             self.start_btn.config(state="normal")
             self.stop_btn.config(state="disabled")
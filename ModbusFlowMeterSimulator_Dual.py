@@ -7,9 +7,121 @@ from tkinter import ttk, scrolledtext
 import threading
 import asyncio
 import struct
+import array
+import os
+import collections
+import logging
+
+from serial.tools import list_ports
+
+from pymodbus.constants import ExcCodes
+from pymodbus.server import ModbusSerialServer
+from pymodbus.datastore import context, ModbusSequentialDataBlock
+
+
+class GuiLogHandler(logging.Handler):
+    """Forward formatted records to a thread-safe sink such as DualFlowMeterGUI.log"""
+    def __init__(self, sink):
+        super().__init__()
+        self.sink = sink
+    
+    def emit(self, record):
+        try:
+            self.sink(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+class ArrayDataBlock(ModbusSequentialDataBlock):
+    """Dense block stored as array('H'): setValues is one slice assignment, no dict hashing"""
+    def __init__(self, address, count):
+        super().__init__(address, [0] * count)
+        self.values = array.array('H', self.values)
+
+    def getValues(self, address, count=1):
+        # Same range check as the base class (pymodbus 3.11 doesn't call validate() first)
+        start = address - self.address
+        if start < 0 or start + count > len(self.values):
+            return ExcCodes.ILLEGAL_ADDRESS
+        return self.values[start:start + count].tolist()
+
+    def setValues(self, address, values):
+        if not isinstance(values, list):
+            values = [values]
+        start = address - self.address
+        # Checked first: slice assignment past the end would grow the array instead of failing
+        if start < 0 or start + len(values) > len(self.values):
+            return ExcCodes.ILLEGAL_ADDRESS
+        self.values[start:start + len(values)] = array.array('H', values)
+        return None
+    
+    def fast_set(self, address, words):
+        """setValues for the app's own writes: words is already a list of in-range registers"""
+        start = address - self.address
+        self.values[start:start + len(words)] = array.array('H', words)
+
+
+_PACK_U32 = struct.Struct('>I').pack
+_PACK_F32 = struct.Struct('>f').pack
+
+# Per byte order of a big-endian ABCD value: how to read its 4 bytes as two words, and whether to swap them
+_BYTE_ORDER_UNPACK = {
+    "ABCD": (struct.Struct('>HH').unpack, False),
+    "CDAB": (struct.Struct('>HH').unpack, True),  # Swapped words, what the EdgeBox getFloat()/getUint32() expect
+    "BADC": (struct.Struct('<HH').unpack, False),
+    "DCBA": (struct.Struct('<HH').unpack, True),
+}
+BYTE_ORDER = "CDAB"
+_UNPACK_H2, _SWAP_WORDS = _BYTE_ORDER_UNPACK[BYTE_ORDER]
+
+def _pack_words_32(b):
+    """4 big-endian bytes -> 2 register words in BYTE_ORDER"""
+    w0, w1 = _UNPACK_H2(b)
+    return [w1, w0] if _SWAP_WORDS else [w0, w1]
+
+def pack_uint32(value):
+    """Pack uint32 with swapped word order"""
+    return _pack_words_32(_PACK_U32(value))
+
+def pack_uint16(value):
+    return [value & 0xFFFF]
+
+def pack_float32(value):
+    """Pack float32 with swapped word order"""
+    return _pack_words_32(_PACK_F32(value))
+
+_PACKERS = {'uint16': pack_uint16, 'uint32': pack_uint32, 'float32': pack_float32}
+_WIDTH = {'uint16': 1, 'uint32': 2, 'float32': 2}
+
+# Input register layout in address order: (address, type, source); source is the GUI attribute
+# mirroring the value, or a constant
+_IR_LAYOUT = (
+    (772, 'uint32', '_total_flow'),     # 772-773: Total Flow
+    (774, 'uint16', 3),                 # 774: Unit Info - 3 = m3/h
+    (777, 'uint16', 0),                 # 777: Alarm flags - no alarms
+    (778, 'float32', '_flow_rate'),     # 778-779: Flow Rate
+    (786, 'uint16', 0),                 # 786: Overflow count
+    (812, 'float32', '_conductivity'),  # 812-813: Conductivity
+)
+
+def _plan_runs(layout, max_gap=4):
+    """Merge entries fewer than max_gap words apart -> ((base, length, offsets), ...), one setValues per run"""
+    runs = []
+    for addr, typ, _ in layout:
+        width = _WIDTH[typ]
+        if runs and addr - (runs[-1][0] + runs[-1][1]) < max_gap:
+            base, _, offsets = runs[-1]
+            runs[-1] = (base, addr + width - base, offsets + (addr - base,))
+        else:
+            runs.append((addr, width, (0,)))
+    return tuple(runs)
+
+_IR_RUNS = _plan_runs(_IR_LAYOUT)  # 772-779 (gaps zero-filled), 786, 812-813
+
+UPDATE_DELAY_MS = 100  # Changes within this window are written together
+SLIDER_DEBOUNCE_MS = 30
+LOG_DRAIN_MS = 100     # Log lines are appended to the widget in one batch per interval
+LOG_MAX_LINES = 2000   # Bound on both the pending queue and the log widget
 
-from pymodbus.server import StartAsyncSerialServer
-from pymodbus.datastore import context, sparse
 
 class DualFlowMeterGUI:
     def __init__(self, root):
@@ -19,6 +131,8 @@ class DualFlowMeterGUI:
         
         self.server_running = False
         self.server_thread = None
+        self._asyncio_loop = None  # The server thread's loop; owns the data blocks once running
+        self._stop_event = None    # asyncio.Event on that loop; set it (thread-safely) to stop the server
         
         # Variables
         self.var_port = tk.StringVar(value="COM18")
@@ -26,8 +140,30 @@ class DualFlowMeterGUI:
         self.var_flow_rate = tk.DoubleVar(value=125.5)
         self.var_conductivity = tk.DoubleVar(value=450.2)
         self.var_total_flow = tk.IntVar(value=1000000)
+        self.var_debug_log = tk.BooleanVar(value=False)
+        
+        # Keys of variables changed since the last register write, and the words last written per run.
+        # Writes are pushed from these traces; nothing polls while the values are idle.
+        self._dirty = set()
+        self._last_words = {}  # run base -> words last written to every device block
+        self._device_blocks = ()  # Input register blocks of all served devices, set by start_server
+        self._update_pending = False
+        self._pending_slider = {}  # variable name -> after() id of its not-yet-committed slider position
+        # Plain-attribute mirrors of the variables (self._flow_rate, ...), refreshed by the traces so the
+        # update path never round-trips through Tcl
+        for key, var in (("flow_rate", self.var_flow_rate), ("conductivity", self.var_conductivity),
+                         ("total_flow", self.var_total_flow)):
+            setattr(self, '_' + key, var.get())
+            var.trace_add('write', lambda *_, k=key, v=var: self._on_var_changed(k, v))
+        self._ir_schedule = self._build_ir_schedule()
+        
+        # Lines from any thread; deque appends are atomic, so log() never touches Tk
+        self._log_queue = collections.deque(maxlen=LOG_MAX_LINES)
         
         self._init_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(LOG_DRAIN_MS, self._drain_log)
+        self._setup_pymodbus_logging()
         
     def _init_ui(self):
         # Connection Frame
@@ -45,18 +181,22 @@ class DualFlowMeterGUI:
         self.btn_start = ttk.Button(conn_frame, text="Start Server", command=self.start_server)
         self.btn_start.grid(row=0, column=5, padx=10)
         
+        ttk.Checkbutton(conn_frame, text="Verbose logging", variable=self.var_debug_log,
+                        command=self._apply_log_level).grid(row=1, column=0, columnspan=2, sticky="w", padx=5, pady=(5, 0))
+        
         # Data Frame
         data_frame = ttk.LabelFrame(self.root, text="Sensor Values (Both Devices)", padding=10)
         data_frame.pack(fill="x", padx=10, pady=5)
         
         ttk.Label(data_frame, text="Flow Rate:").grid(row=0, column=0, sticky="w", padx=5)
-        ttk.Scale(data_frame, from_=0, to=500, variable=self.var_flow_rate, 
-                 command=lambda v: self.var_flow_rate.set(round(float(v), 1))).grid(row=0, column=1, sticky="ew", padx=5)
+        # Sliders aren't bound to the variables directly: drags are debounced into them (see _on_slider)
+        ttk.Scale(data_frame, from_=0, to=500, value=self.var_flow_rate.get(),
+                 command=lambda v: self._on_slider(self.var_flow_rate, v)).grid(row=0, column=1, sticky="ew", padx=5)
         ttk.Label(data_frame, textvariable=self.var_flow_rate, width=10).grid(row=0, column=2, padx=5)
         
         ttk.Label(data_frame, text="Conductivity:").grid(row=1, column=0, sticky="w", padx=5, pady=5)
-        ttk.Scale(data_frame, from_=0, to=1000, variable=self.var_conductivity,
-                 command=lambda v: self.var_conductivity.set(round(float(v), 1))).grid(row=1, column=1, sticky="ew", padx=5)
+        ttk.Scale(data_frame, from_=0, to=1000, value=self.var_conductivity.get(),
+                 command=lambda v: self._on_slider(self.var_conductivity, v)).grid(row=1, column=1, sticky="ew", padx=5)
         ttk.Label(data_frame, textvariable=self.var_conductivity, width=10).grid(row=1, column=2, padx=5)
         
         ttk.Label(data_frame, text="Total Flow:").grid(row=2, column=0, sticky="w", padx=5)
@@ -71,15 +211,47 @@ class DualFlowMeterGUI:
         self.log_area = scrolledtext.ScrolledText(log_frame, height=15, state='normal', font=("Consolas", 9))
         self.log_area.pack(fill="both", expand=True)
         
-        # Start update loop
-        self.update_registers()
+    def _on_slider(self, var, v):
+        """Commit only the last slider position within SLIDER_DEBOUNCE_MS to var"""
+        after_id = self._pending_slider.pop(str(var), None)
+        if after_id is not None:
+            self.root.after_cancel(after_id)
+        self._pending_slider[str(var)] = self.root.after(SLIDER_DEBOUNCE_MS, self._commit_slider, var, v)
+    
+    def _commit_slider(self, var, v):
+        self._pending_slider.pop(str(var), None)
+        var.set(round(float(v), 1))
         
+    def _setup_pymodbus_logging(self):
+        """Route pymodbus records into the log pane only; WARNING unless verbose logging is ticked"""
+        logger = logging.getLogger("pymodbus")
+        logger.propagate = False
+        for handler in [h for h in logger.handlers if isinstance(h, GuiLogHandler)]:
+            logger.removeHandler(handler)
+        handler = GuiLogHandler(self.log)
+        handler.setFormatter(logging.Formatter("pymodbus %(levelname)s: %(message)s"))
+        logger.addHandler(handler)
+        self._apply_log_level()
+    
+    def _apply_log_level(self):
+        # DEBUG makes pymodbus format a record for every frame, so it is opt-in
+        logging.getLogger("pymodbus").setLevel(logging.DEBUG if self.var_debug_log.get() else logging.WARNING)
+    
     def log(self, message):
         """Thread-safe logging"""
-        def append():
-            self.log_area.insert(tk.END, message + '\n')
+        self._log_queue.append(message)
+    
+    def _drain_log(self):
+        """Append everything logged since the last drain in a single insert, then trim the widget"""
+        queue = self._log_queue
+        if queue:
+            lines = [queue.popleft() for _ in range(len(queue))]
+            self.log_area.insert(tk.END, '\n'.join(lines) + '\n')
+            excess = int(self.log_area.index('end-1c').split('.')[0]) - 1 - LOG_MAX_LINES
+            if excess > 0:
+                self.log_area.delete('1.0', f'{excess + 1}.0')
             self.log_area.see(tk.END)
-        self.root.after(0, append)
+        self.root.after(LOG_DRAIN_MS, self._drain_log)
         
     def start_server(self):
         if self.server_running:
@@ -89,6 +261,12 @@ class DualFlowMeterGUI:
         port = self.var_port.get()
         baud = int(self.var_baud.get())
         
+        # Preflight without opening the port (the server does the one real open); device paths such as
+        # ptys don't show up in comports(), so accept anything that exists on disk too
+        if port not in {p.device for p in list_ports.comports()} and not os.path.exists(port):
+            self.log(f"✗ ERROR: Port {port} not found")
+            return
+        
         self.log("=" * 60)
         self.log(f"Starting Modbus RTU Server...")
         self.log(f"Port: {port}, Baud: {baud}")
@@ -96,15 +274,9 @@ class DualFlowMeterGUI:
         self.log("=" * 60)
         
         # Create data blocks for both devices
-        self.data_block_110 = sparse.ModbusSparseDataBlock({
-            772: [0]*20,  # Covers 772-791
-            812: [0]*4
-        })
-        
-        self.data_block_111 = sparse.ModbusSparseDataBlock({
-            772: [0]*20,  # Covers 772-791
-            812: [0]*4
-        })
+        self.data_block_110 = ArrayDataBlock(772, 44)  # Covers 772-815
+        self.data_block_111 = ArrayDataBlock(772, 44)  # Covers 772-815
+        self._device_blocks = (self.data_block_110, self.data_block_111)
         
         # Create device contexts
         store_110 = context.ModbusDeviceContext(ir=self.data_block_110)
@@ -119,6 +291,10 @@ class DualFlowMeterGUI:
             single=False
         )
         
+        # Fresh blocks: write everything before the server starts answering
+        self._last_words.clear()
+        self.update_registers()
+        
         # Start server thread
         self.server_running = True
         self.server_thread = threading.Thread(target=self._run_server, args=(port, baud), daemon=True)
@@ -129,15 +305,17 @@ class DualFlowMeterGUI:
         
     def _run_server(self, port, baud):
         """Run the async server in a thread"""
+        # Create new event loop for this thread
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._asyncio_loop = loop
         try:
-            # Create new event loop for this thread
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
             async def serve():
+                self._stop_event = asyncio.Event()
                 self.log("✓ Async server starting...")
-                await StartAsyncSerialServer(
-                    context=self.server_context,
+                # serve_forever() runs until shutdown(); built directly so stop can call that
+                server = ModbusSerialServer(
+                    self.server_context,
                     port=port,
                     baudrate=baud,
                     bytesize=8,
@@ -145,69 +323,106 @@ class DualFlowMeterGUI:
                     stopbits=1,
                     timeout=1
                 )
+                serve_task = asyncio.ensure_future(server.serve_forever())
+                stop_task = asyncio.ensure_future(self._stop_event.wait())
                 self.log("✓ Server is now listening for requests!")
                 self.log("✓ Responding to slave IDs: 110 and 111")
+                
+                done, _ = await asyncio.wait((serve_task, stop_task), return_when=asyncio.FIRST_COMPLETED)
+                stop_task.cancel()
+                if serve_task in done:
+                    serve_task.result()  # Surface startup errors (e.g. port busy)
+                else:
+                    # Cancelling serve_forever() alone leaves the serial transport open (it swallows
+                    # the CancelledError); shutdown() closes the port and ends serve_forever()
+                    await server.shutdown()
+                    await asyncio.gather(serve_task, return_exceptions=True)
             
-            # Start server and run forever
+            # One pass: returns when the server exits or is stopped
             loop.run_until_complete(serve())
-            loop.run_forever()
             
         except Exception as e:
             self.log(f"✗ ERROR: {type(e).__name__}: {e}")
             import traceback
             self.log(traceback.format_exc())
+        finally:
             self.server_running = False
+            self._asyncio_loop = None
+            loop.close()
+    
+    def on_close(self):
+        """Stop the server loop cleanly, then close the window"""
+        loop, stop = self._asyncio_loop, self._stop_event
+        if loop is not None and stop is not None:
+            # No join: the daemon thread winds down on its own; waiting here would only freeze the window
+            try:
+                loop.call_soon_threadsafe(stop.set)
+            except RuntimeError:
+                pass  # Loop already closed (server exited on its own)
+        self.root.destroy()
             
+    def _build_ir_schedule(self):
+        """
+        Freeze _IR_LAYOUT/_IR_RUNS into ((base, length, ((offset, pack, get), ...)), ...), bound once
+        so the write path does no lookups, type checks or bookkeeping.
+        """
+        entries = iter(_IR_LAYOUT)
+        schedule = []
+        for base, length, offsets in _IR_RUNS:
+            parts = []
+            for off in offsets:
+                _, typ, source = next(entries)
+                if isinstance(source, str):
+                    get = (lambda name=source: getattr(self, name))
+                else:
+                    get = (lambda value=source: value)
+                parts.append((off, _PACKERS[typ], get))
+            schedule.append((base, length, tuple(parts)))
+        return tuple(schedule)
+    
+    def _on_var_changed(self, key, var):
+        try:
+            setattr(self, '_' + key, var.get())
+        except (tk.TclError, ValueError):
+            return  # Half-typed entry text; keep the last good value
+        self._dirty.add(key)
+        if not self._update_pending:
+            self._update_pending = True
+            self.root.after(UPDATE_DELAY_MS, self.update_registers)
+    
     def update_registers(self):
-        """Update Modbus registers with current values"""
-        if self.server_running and hasattr(self, 'data_block_110'):
-            try:
-                # Helper functions
-                def pack_uint32(value):
-                    """Pack uint32 with swapped word order"""
-                    packed = struct.pack('>I', value)
-                    word0 = struct.unpack('>H', packed[0:2])[0]
-                    word1 = struct.unpack('>H', packed[2:4])[0]
-                    return [word1, word0]
-                
-                def pack_uint16(value):
-                    return [value & 0xFFFF]
-                
-                def pack_float32(value):
-                    """Pack float32 with swapped word order"""
-                    packed = struct.pack('>f', value)
-                    word0 = struct.unpack('>H', packed[0:2])[0]
-                    word1 = struct.unpack('>H', packed[2:4])[0]
-                    return [word1, word0]
-                
-                # Update both devices with same data
-                for block in [self.data_block_110, self.data_block_111]:
-                    # 772-773: Total Flow (uint32)
-                    total_regs = pack_uint32(self.var_total_flow.get())
-                    block.setValues(772, total_regs)
-                    
-                    # 774: Unit Info (uint16) - 3 = m3/h
-                    block.setValues(774, pack_uint16(3))
-                    
-                    # 777: Alarm flags (uint16)
-                    block.setValues(777, pack_uint16(0))  # No alarms
-                    
-                    # 778-779: Flow Rate (float32)
-                    flow_regs = pack_float32(self.var_flow_rate.get())
-                    block.setValues(778, flow_regs)
-                    
-                    # 786: Overflow count (uint16)
-                    block.setValues(786, pack_uint16(0))
-                    
-                    # 812-813: Conductivity (float32)
-                    cond_regs = pack_float32(self.var_conductivity.get())
-                    block.setValues(812, cond_regs)
-                
-            except Exception as e:
-                self.log(f"Update error: {e}")
-                
-        # Schedule next update
-        self.root.after(500, self.update_registers)
+        """Hand pending changes (already mirrored by the traces) to the server loop for packing/writing"""
+        self._update_pending = False
+        # Nothing to do unless a value changed or the blocks haven't been written yet
+        if not self._device_blocks or not (self._dirty or not self._last_words):
+            return
+        self._dirty.clear()
+        
+        loop = self._asyncio_loop
+        if loop is not None and loop.is_running():
+            loop.call_soon_threadsafe(self._apply_pending_updates)
+        else:
+            self._apply_pending_updates()
+    
+    def _apply_pending_updates(self):
+        """Pack the mirrored values and write them to both devices (server loop, or before it starts)"""
+        try:
+            # Pack each run once, then hand the same words to every device before moving on.
+            # All blocks always receive identical writes, so one diff per run covers them all.
+            last = self._last_words
+            blocks = self._device_blocks
+            for base, length, parts in self._ir_schedule:
+                regs = [0] * length
+                for off, pack, get in parts:
+                    words = pack(get())
+                    regs[off:off + len(words)] = words
+                if last.get(base) != regs:
+                    last[base] = regs
+                    for block in blocks:
+                        block.fast_set(base, regs)
+            
+        except Exception as e:
+            self.log(f"Update error: {e}")
 
 if __name__ == "__main__":
     root = tk.Tk()
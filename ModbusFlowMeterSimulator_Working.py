@@ -8,9 +8,43 @@ import threading
 import asyncio
 import struct
 import sys
+import collections
 
 from pymodbus.server import StartAsyncSerialServer
-from pymodbus.datastore import context, sparse
+from pymodbus.datastore import context, ModbusSequentialDataBlock
+
+# Compiled once; pack_float32 below runs on every value update
+_PACK_F32 = struct.Struct('>f').pack
+
+def pack_uint32(value):
+    """uint32 -> [MSW, LSW]; plain integer math, wraps modulo 2**32 like the meter's counter"""
+    value &= 0xFFFFFFFF
+    return [value >> 16, value & 0xFFFF]
+
+def pack_uint16(value):
+    return [value & 0xFFFF]
+
+def pack_float32(value):
+    """IEEE-754 float32 -> [MSW, LSW]"""
+    b = _PACK_F32(value)  # Big-endian bytes, so b[0:2] is the MSW
+    return [(b[0] << 8) | b[1], (b[2] << 8) | b[3]]
+
+# 774: Unit Info (uint16), 3 = m3/h. Never changes, so it is packed here and placed once per data block
+UNIT_INFO_REGS = pack_uint16(3)
+
+# Every live register fits in 772-813; updates rewrite that whole span with a single setValues
+IR_BASE = 772
+IR_SPAN = 42
+
+# Live input registers: variable key (self.var_<key>) -> (start address, packer)
+IR_VALUES = {
+    'total_flow': (772, pack_uint32),     # 772-773: Total Flow (uint32)
+    'flow_rate': (778, pack_float32),     # 778-779: Flow Rate (float32)
+    'conductivity': (812, pack_float32),  # 812-813: Conductivity (float32)
+}
+
+LOG_DRAIN_MS = 100     # Log lines are appended to the widget in one batch per interval
+LOG_MAX_LINES = 2000   # Bound on both the pending queue and the log widget
 
 class SimpleFlowMeterGUI:
     def __init__(self, root):
@@ -29,7 +63,19 @@ class SimpleFlowMeterGUI:
         self.var_conductivity = tk.DoubleVar(value=450.2)
         self.var_total_flow = tk.IntVar(value=1000000)
         
+        # Value last written to the data block per key; rewriting an unchanged value is skipped
+        self._last_vals = {}
+        # Bound var.get per key, looked up once here rather than on every update
+        self._getters = {key: getattr(self, 'var_' + key).get for key in IR_VALUES}
+        # Registers are pushed from write traces, so nothing polls while the values are idle
+        for key in IR_VALUES:
+            getattr(self, 'var_' + key).trace_add('write', lambda *_, k=key: self._on_var_changed(k))
+        
+        # Lines from any thread; deque appends are atomic, so log() never touches Tk
+        self._log_queue = collections.deque(maxlen=LOG_MAX_LINES)
+        
         self._init_ui()
+        self.root.after(LOG_DRAIN_MS, self._drain_log)
         
     def _init_ui(self):
         # Connection Frame
@@ -74,15 +120,21 @@ class SimpleFlowMeterGUI:
         self.log_area = scrolledtext.ScrolledText(log_frame, height=15, state='normal', font=("Consolas", 9))
         self.log_area.pack(fill="both", expand=True)
         
-        # Start update loop
-        self.update_registers()
-        
     def log(self, message):
         """Thread-safe logging"""
-        def append():
-            self.log_area.insert(tk.END, message + '\n')
+        self._log_queue.append(message)
+    
+    def _drain_log(self):
+        """Append everything logged since the last drain in a single insert, then trim the widget"""
+        queue = self._log_queue
+        if queue:
+            lines = [queue.popleft() for _ in range(len(queue))]
+            self.log_area.insert(tk.END, '\n'.join(lines) + '\n')
+            excess = int(self.log_area.index('end-1c').split('.')[0]) - 1 - LOG_MAX_LINES
+            if excess > 0:
+                self.log_area.delete('1.0', f'{excess + 1}.0')
             self.log_area.see(tk.END)
-        self.root.after(0, append)
+        self.root.after(LOG_DRAIN_MS, self._drain_log)
         
     def start_server(self):
         if self.server_running:
@@ -99,10 +151,16 @@ class SimpleFlowMeterGUI:
         self.log("=" * 50)
         
         # Create data block
-        self.data_block = sparse.ModbusSparseDataBlock({
-            772: [0]*20,  # Covers 772-791
-            812: [0]*4
-        })
+        # One dense list indexed by offset, as in the dual simulator, instead of a sparse address dict
+        self.data_block = ModbusSequentialDataBlock(772, [0]*44)  # Covers 772-815
+        
+        # Image of IR_BASE..IR_BASE+IR_SPAN-1, patched in place and written out in one call
+        self._ir_payload = [0] * IR_SPAN
+        self._ir_payload[774 - IR_BASE:775 - IR_BASE] = UNIT_INFO_REGS
+        
+        # Fresh block: write every value before the server starts answering
+        self._last_vals = {}
+        self.update_registers()
         
         # Create device context
         store = context.ModbusDeviceContext(ir=self.data_block)
@@ -148,43 +206,37 @@ class SimpleFlowMeterGUI:
             self.log(traceback.format_exc())
             self.server_running = False
             
-    def update_registers(self):
-        """Update Modbus registers with current values"""
-        if self.server_running and hasattr(self, 'data_block'):
+    def _on_var_changed(self, key):
+        """Write trace: push just this value's registers while the server is running"""
+        if self.server_running:
+            self.update_registers((key,))
+    
+    def update_registers(self, keys=IR_VALUES):
+        """Update Modbus registers for the given value keys (default: all) whose values changed"""
+        if not hasattr(self, 'data_block'):
+            return
+        getters, last, payload = self._getters, self._last_vals, self._ir_payload
+        changed = not last  # Fresh block: the span (unit info included) has never been written
+        for key in keys:
+            try:
+                value = getters[key]()
+            except (tk.TclError, ValueError) as e:
+                # Half-typed or invalid entry text: keep the last good value for this key
+                self.log(f"⚠ Ignoring invalid {key}: {e}")
+                continue
+            if value != last.get(key):
+                addr, pack = IR_VALUES[key]
+                words = pack(value)
+                off = addr - IR_BASE
+                payload[off:off + len(words)] = words
+                last[key] = value
+                changed = True
+        if changed:
             try:
-                # Helper functions
-                def pack_uint32(value):
-                    packed = struct.pack('>I', value)
-                    return [struct.unpack('>H', packed[i:i+2])[0] for i in range(0, 4, 2)]
-                
-                def pack_uint16(value):
-                    return [value & 0xFFFF]
-                
-                def pack_float32(value):
-                    packed = struct.pack('>f', value)
-                    return [struct.unpack('>H', packed[i:i+2])[0] for i in range(0, 4, 2)]
-                
-                # Update registers
-                # 772-773: Total Flow (uint32)
-                total_regs = pack_uint32(self.var_total_flow.get())
-                self.data_block.setValues(772, total_regs)
-                
-                # 774: Unit Info (uint16)
-                self.data_block.setValues(774, pack_uint16(3))  # 3 = m3/h
-                
-                # 778-779: Flow Rate (float32)
-                flow_regs = pack_float32(self.var_flow_rate.get())
-                self.data_block.setValues(778, flow_regs)
-                
-                # 812-813: Conductivity (float32)
-                cond_regs = pack_float32(self.var_conductivity.get())
-                self.data_block.setValues(812, cond_regs)
-                
+                self.data_block.setValues(IR_BASE, payload)
             except Exception as e:
-                pass  # Silently ignore update errors
-                
-        # Schedule next update
-        self.root.after(500, self.update_registers)
+                self.log(f"✗ Register update failed: {type(e).__name__}: {e}")
+                last.clear()  # Unknown block state: rewrite everything on the next update
 
 if __name__ == "__main__":
     root = tk.Tk()
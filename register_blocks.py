@@ -0,0 +1,60 @@
+"""
+array('H')-backed replacements for pymodbus' ModbusSequentialDataBlock, shared by the simulators.
+"""
+import array
+
+
+def _illegal_address():
+    # Imported here so the simulators that resolve pymodbus lazily don't pay for it at import time
+    from pymodbus.constants import ExcCodes
+    return ExcCodes.ILLEGAL_ADDRESS
+
+
+class RegisterArrayBlock:
+    """
+    Sequential register block backed by array('H') (2 bytes per register).
+    Same interface as ModbusSequentialDataBlock as far as the device contexts use it;
+    pymodbus' own block copies its values into a list of Python ints.
+
+    pymodbus 3.11 never calls validate() before a read or write, so getValues/setValues
+    do the range check themselves and answer ILLEGAL_ADDRESS, like ModbusSequentialDataBlock.
+    """
+    __slots__ = ('address', 'values')
+
+    def __init__(self, address, values):
+        self.address = address
+        self.values = array.array('H', values)
+
+    def reset(self):
+        self.values = array.array('H', bytes(2 * len(self.values)))
+
+    def validate(self, address, count=1):
+        return self.address <= address and address + count <= self.address + len(self.values)
+
+    def getValues(self, address, count=1):
+        # An array slice (one memcpy) rather than a list: register responses only iterate it
+        start = address - self.address
+        if start < 0 or start + count > len(self.values):
+            return _illegal_address()
+        return self.values[start:start + count]
+
+    def setValues(self, address, values):
+        if not isinstance(values, list):
+            values = [values]
+        start = address - self.address
+        # Checked first: slice assignment past the end would grow the array instead of failing
+        if start < 0 or start + len(values) > len(self.values):
+            return _illegal_address()
+        self.values[start:start + len(values)] = array.array('H', values)
+        return None
+
+
+class BitArrayBlock(RegisterArrayBlock):
+    """Coil / discrete input block: pymodbus pads bit reads with `bits += [...]`, so these must be lists"""
+    __slots__ = ()
+
+    def getValues(self, address, count=1):
+        start = address - self.address
+        if start < 0 or start + count > len(self.values):
+            return _illegal_address()
+        return self.values[start:start + count].tolist()
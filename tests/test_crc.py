@@ -0,0 +1,23 @@
+import unittest
+
+from ModbusFlowMeterSimulator import crc16_modbus
+
+
+class Crc16ModbusTest(unittest.TestCase):
+    """Standard CRC-16/MODBUS vectors against the import-time lookup table"""
+
+    def test_check_string(self):
+        self.assertEqual(crc16_modbus(b"123456789"), 0x4B37)
+
+    def test_read_holding_request(self):
+        # 01 03 00 00 00 01 goes out on the wire as ... 84 0A (low byte first)
+        crc = crc16_modbus(bytes.fromhex("010300000001"))
+        self.assertEqual(crc, 0x0A84)
+        self.assertEqual(crc.to_bytes(2, "little"), b"\x84\x0a")
+
+    def test_empty(self):
+        self.assertEqual(crc16_modbus(b""), 0xFFFF)
+
+
+if __name__ == '__main__':
+    unittest.main()
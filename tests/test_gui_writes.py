@@ -0,0 +1,26 @@
+import array
+import unittest
+
+from pymodbus.datastore import ModbusDeviceContext
+
+import ModbusFlowMeterSimulator as flowmeter
+from register_blocks import RegisterArrayBlock
+
+
+class FlowMeterReapplyTest(unittest.TestCase):
+    """A GUI write must reach the store even if it repeats the GUI's previous value"""
+
+    def test_reapply_after_master_write(self):
+        app = flowmeter.FlowMeterSimulatorApp.__new__(flowmeter.FlowMeterSimulatorApp)
+        app._live = array.array('H', bytes(2000))
+        app._reg_addrs = set()
+        app.store = ModbusDeviceContext(hr=RegisterArrayBlock(0, bytes(2000)))
+
+        app.update_registers_direct(778, [0x4120, 0x0000])
+        app.store.setValues(3, 778, [0xFFFF, 0xFFFF])  # what an FC16 from the master does
+        app.update_registers_direct(778, [0x4120, 0x0000])
+        self.assertEqual(list(app.store.getValues(3, 778, 2)), [0x4120, 0x0000])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import logging
+import unittest
+
+import ModbusEnergyMeterSimulator_ADL400 as adl400
+
+
+class _FakeText:
+    def tag_config(self, *args, **kwargs):
+        pass
+
+
+class ADL400DeviceSpamTest(unittest.TestCase):
+    """pymodbus logs through the child logger "pymodbus.logging"; the spam filter must still apply"""
+
+    def setUp(self):
+        for name in ("pymodbus", "SimApp"):
+            logger = logging.getLogger(name)
+            saved = (logger.level, logger.handlers[:], logger.propagate)
+            self.addCleanup(self._restore, logger, saved)
+        self.app = adl400.EnergyMeterSimulatorApp.__new__(adl400.EnergyMeterSimulatorApp)
+        self.app.log_text = _FakeText()
+        self.app._setup_logging()
+
+    @staticmethod
+    def _restore(logger, saved):
+        logger.level, logger.handlers, logger.propagate = saved
+
+    def test_device_100_dropped(self):
+        logging.getLogger("pymodbus.logging").error("requested device id does not exist: 100")
+        self.assertEqual(len(self.app.log_handler.records), 0)
+
+    def test_other_errors_kept(self):
+        logging.getLogger("pymodbus.logging").error("requested device id does not exist: 7")
+        (msg, tag), = self.app.log_handler.records
+        self.assertIn("does not exist: 7", msg)
+        self.assertEqual(tag, "INFO")
+
+
+if __name__ == '__main__':
+    unittest.main()
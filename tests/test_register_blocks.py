@@ -0,0 +1,106 @@
+import asyncio
+import unittest
+
+from pymodbus.constants import ExcCodes
+from pymodbus.pdu import ExceptionResponse
+from pymodbus.datastore import ModbusDeviceContext
+from pymodbus.pdu.bit_message import ReadCoilsRequest
+from pymodbus.pdu.register_message import ReadInputRegistersRequest, WriteMultipleRegistersRequest
+
+from ModbusEnergyMeterSimulator_ADL400 import ModbusSlaveContext
+import ModbusFlowMeterSimulator_Complete as complete
+from ModbusFlowMeterSimulator_Dual import ArrayDataBlock
+from register_blocks import BitArrayBlock, RegisterArrayBlock
+
+
+class ADL400RangeTest(unittest.TestCase):
+    """Requests past the end of the ADL400's 150-word blocks, served through its context shim"""
+
+    def setUp(self):
+        self.hr = RegisterArrayBlock(0, bytes(2 * 150))
+        self.ir = RegisterArrayBlock(0, bytes(2 * 150))
+        self.context = ModbusSlaveContext(hr=self.hr, ir=self.ir)
+
+    def test_read_past_end_is_illegal_address(self):
+        response = asyncio.run(ReadInputRegistersRequest(address=140, count=20).update_datastore(self.context))
+        self.assertIsInstance(response, ExceptionResponse)
+        self.assertEqual(response.exception_code, ExcCodes.ILLEGAL_ADDRESS)
+
+    def test_write_past_end_is_illegal_address_and_keeps_size(self):
+        request = WriteMultipleRegistersRequest(address=148, registers=[1, 2, 3, 4, 5])
+        response = asyncio.run(request.update_datastore(self.context))
+        self.assertIsInstance(response, ExceptionResponse)
+        self.assertEqual(response.exception_code, ExcCodes.ILLEGAL_ADDRESS)
+        self.assertEqual(len(self.hr.values), 150)
+        self.assertEqual(self.hr.values[148:].tolist(), [0, 0])
+
+    def test_in_range_read(self):
+        self.ir.setValues(140, [7] * 10)
+        response = asyncio.run(ReadInputRegistersRequest(address=140, count=10).update_datastore(self.context))
+        self.assertEqual(list(response.registers), [7] * 10)
+
+
+class FlowMeterRangeTest(unittest.TestCase):
+    """The same blocks behind pymodbus' own device context, as ModbusFlowMeterSimulator builds it"""
+
+    def setUp(self):
+        self.hr = RegisterArrayBlock(0, bytes(2000))
+        self.context = ModbusDeviceContext(co=BitArrayBlock(0, bytes(2000)), hr=self.hr)
+
+    def test_coil_read_past_end_is_illegal_address(self):
+        response = asyncio.run(ReadCoilsRequest(address=995, count=8).update_datastore(self.context))
+        self.assertIsInstance(response, ExceptionResponse)
+        self.assertEqual(response.exception_code, ExcCodes.ILLEGAL_ADDRESS)
+
+    def test_holding_write_past_end_keeps_size(self):
+        request = WriteMultipleRegistersRequest(address=997, registers=[1, 2, 3, 4])
+        response = asyncio.run(request.update_datastore(self.context))
+        self.assertIsInstance(response, ExceptionResponse)
+        self.assertEqual(len(self.hr.values), 1000)
+
+
+class CompleteRangeTest(unittest.TestCase):
+    """ModbusFlowMeterSimulator_Complete's shim, with IR sharing the HR array as start_server sets it up"""
+
+    def setUp(self):
+        self.hr = RegisterArrayBlock(0, bytes(2000))
+        ir = RegisterArrayBlock(0, ())
+        ir.values = self.hr.values
+        self.context = complete.ModbusSlaveContext(hr=self.hr, ir=ir)
+
+    def test_read_past_end_is_illegal_address(self):
+        response = asyncio.run(ReadInputRegistersRequest(address=990, count=20).update_datastore(self.context))
+        self.assertIsInstance(response, ExceptionResponse)
+        self.assertEqual(response.exception_code, ExcCodes.ILLEGAL_ADDRESS)
+
+    def test_write_past_end_is_illegal_address_and_keeps_size(self):
+        request = WriteMultipleRegistersRequest(address=998, registers=[1, 2, 3])
+        response = asyncio.run(request.update_datastore(self.context))
+        self.assertIsInstance(response, ExceptionResponse)
+        self.assertEqual(response.exception_code, ExcCodes.ILLEGAL_ADDRESS)
+        self.assertEqual(len(self.hr.values), 1000)
+
+
+class DualRangeTest(unittest.TestCase):
+    """ModbusFlowMeterSimulator_Dual's 772-815 input register block"""
+
+    def setUp(self):
+        self.block = ArrayDataBlock(772, 44)
+        self.context = ModbusDeviceContext(ir=self.block)
+
+    def test_reads_outside_block_are_illegal_address(self):
+        # ModbusDeviceContext adds 1 to the request address
+        for address, count in ((700, 2), (800, 20)):
+            response = asyncio.run(ReadInputRegistersRequest(address=address, count=count).update_datastore(self.context))
+            self.assertIsInstance(response, ExceptionResponse)
+            self.assertEqual(response.exception_code, ExcCodes.ILLEGAL_ADDRESS)
+
+    def test_write_past_end_is_illegal_address_and_keeps_size(self):
+        self.assertEqual(self.block.setValues(814, [1, 2, 3]), ExcCodes.ILLEGAL_ADDRESS)
+        self.assertEqual(len(self.block.values), 44)
+        self.assertIsNone(self.block.setValues(814, [1, 2]))
+        self.assertEqual(self.block.getValues(814, 2), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
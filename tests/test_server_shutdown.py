@@ -0,0 +1,87 @@
+import asyncio
+import os
+import threading
+import unittest
+
+from pymodbus.datastore import ModbusServerContext
+
+import ModbusEnergyMeterSimulator_ADL400 as adl400
+import ModbusFlowMeterSimulator_Dual as dual
+
+
+def _spy_servers(module):
+    """Record every ModbusSerialServer the module builds; returns (list, restore)"""
+    servers = []
+    original = module.ModbusSerialServer
+
+    class Spy(original):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            servers.append(self)
+
+    module.ModbusSerialServer = Spy
+    return servers, lambda: setattr(module, 'ModbusSerialServer', original)
+
+
+@unittest.skipUnless(hasattr(os, 'openpty'), "needs a pseudo-terminal to stand in for the serial port")
+class ADL400StopTest(unittest.TestCase):
+    """Stop must close the serial port, not just cancel serve_forever()"""
+
+    def setUp(self):
+        master, slave = os.openpty()
+        self.addCleanup(os.close, master)
+        self.addCleanup(os.close, slave)
+        self.port = os.ttyname(slave)
+        self.servers, restore = _spy_servers(adl400)
+        self.addCleanup(restore)
+
+    def test_stop_closes_transport(self):
+        app = adl400.EnergyMeterSimulatorApp.__new__(adl400.EnergyMeterSimulatorApp)
+        app.stop_server_event = threading.Event()
+        app.my_log = lambda msg: None
+        block = adl400.RegisterArrayBlock(0, bytes(300))
+        app.context = ModbusServerContext(devices={1: adl400.ModbusSlaveContext(hr=block, ir=block)}, single=False)
+
+        async def run():
+            task = asyncio.ensure_future(app.run_async_server(self.port, 9600, 1))
+            await asyncio.sleep(0.3)
+            self.assertIsNotNone(self.servers[0].transport)
+            app._async_stop.set()
+            await asyncio.wait_for(task, 3)
+
+        asyncio.run(run())
+        self.assertIsNone(self.servers[0].transport)
+
+
+@unittest.skipUnless(hasattr(os, 'openpty'), "needs a pseudo-terminal to stand in for the serial port")
+class DualStopTest(unittest.TestCase):
+    """Closing the dual simulator's window must release the serial port"""
+
+    def setUp(self):
+        master, slave = os.openpty()
+        self.addCleanup(os.close, master)
+        self.addCleanup(os.close, slave)
+        self.port = os.ttyname(slave)
+        self.servers, restore = _spy_servers(dual)
+        self.addCleanup(restore)
+
+    def test_stop_event_closes_transport(self):
+        app = dual.DualFlowMeterGUI.__new__(dual.DualFlowMeterGUI)
+        app.log = lambda msg: None
+        app._asyncio_loop = app._stop_event = None
+        app.server_context = ModbusServerContext(devices={110: dual.context.ModbusDeviceContext(ir=dual.ArrayDataBlock(772, 44))}, single=False)
+        thread = threading.Thread(target=app._run_server, args=(self.port, 9600), daemon=True)
+        thread.start()
+        for _ in range(50):
+            if self.servers and self.servers[0].transport is not None:
+                break
+            threading.Event().wait(0.05)
+        self.assertIsNotNone(self.servers[0].transport)
+        app._asyncio_loop.call_soon_threadsafe(app._stop_event.set)
+        thread.join(3)
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(self.servers[0].transport)
+
+
+if __name__ == '__main__':
+    unittest.main()